@@ -12,6 +12,7 @@ from beancount_reds_importers.libtransactionbuilder import paycheck
 #        "main_account":"Income:Employment",
 #        "paycheck_template": {}, # See beancount_reds_importers/libtransactionbuilder/paycheck.py for sample template
 #        "currency": "PENNIES",
+#        "debug": False,  # True writes .debug-pdf-* files to visualize table detection
 #    }),
 #
 
@@ -26,8 +27,9 @@ class Importer(paycheck.Importer, pdfreader.Importer):
         self.pdf_table_extraction_crop = (0, 0, 0, 0)
         self.pdf_table_title_height = 0
         self.pdf_page_break_top = 0
-        # Set this true as you play with the extraction settings and crop to view images of what the pdf parser detects
-        self.debug = True
+        # Set "debug" to True in the config as you play with the extraction settings and crop to
+        # view images of what the pdf parser detects
+        self.debug = self.config.get("debug", False)
 
         self.header_map = {
             "CURRENT": "amount",
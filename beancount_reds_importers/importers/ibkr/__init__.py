@@ -93,10 +93,14 @@ Breakout by Day? No
 """
 
 import datetime
+import os
+import threading
+from collections import OrderedDict, defaultdict
 
 from beancount.core import data
 from beancount.core.number import D
 from loguru import logger
+from lxml import etree
 
 from beancount_reds_importers.libreader import xmlreader
 from beancount_reds_importers.libtransactionbuilder import investments
@@ -108,6 +112,55 @@ class DictToObject:
             setattr(self, key, value)
 
 
+# Recently read Flex Query files, shared by the importer instances (typically one per account) reading
+# them. See FlexQueryIndex.get()
+FLEX_INDEX_CACHE_MAX_ENTRIES = 4
+_flex_indexes = OrderedDict()
+_flex_indexes_lock = threading.Lock()
+
+
+class FlexQueryIndex:
+    """A parsed Flex Query file, with the elements of each account's statement indexed by section,
+    so that looking up an account's trades doesn't search the statements of every other account.
+    Eg: statements["U1234567"]["Trades/Trade"] is the list of that account's Trade elements, and
+    statements["U1234567"]["AccountInformation"] a list of its AccountInformation element."""
+
+    def __init__(self, xmltree):
+        self.xmltree = xmltree
+        self.statements = {}
+        for statement in xmltree.getroot().iterfind("FlexStatements/FlexStatement"):
+            sections = defaultdict(list)
+            for section in statement:
+                if not isinstance(section.tag, str):  # comments, etc.
+                    continue
+                sections[section.tag].append(section)
+                for elem in section:
+                    if isinstance(elem.tag, str):
+                        sections[f"{section.tag}/{elem.tag}"].append(elem)
+            self.statements[statement.get("accountId")] = dict(sections)
+
+    @classmethod
+    def get(cls, file):
+        """Return the (shared) index of file"""
+        try:
+            mtime = os.stat(file).st_mtime_ns
+        except OSError:
+            mtime = None
+        key = (file, mtime)
+        with _flex_indexes_lock:
+            if key in _flex_indexes:
+                _flex_indexes.move_to_end(key)
+                return _flex_indexes[key]
+
+        index = cls(etree.parse(file))
+
+        with _flex_indexes_lock:
+            index = _flex_indexes.setdefault(key, index)
+            while len(_flex_indexes) > FLEX_INDEX_CACHE_MAX_ENTRIES:
+                _flex_indexes.popitem(last=False)
+        return index
+
+
 # xml on left, ofx on right
 ofx_type_map = {
     "BUY": "buystock",
@@ -126,6 +179,26 @@ class Importer(investments.Importer, xmlreader.Importer):
             self.date_format = "%Y-%m-%d"
             self.get_ticker_info = self.get_ticker_info_from_id
             self.price_cost_both_zero_handler = self.price_cost_both_zero_handler_booktrades
+            if self.config.get("stream_xml", False) and self.config.get("account_number", None):
+                # Only keep the statement for the configured account in memory. See README.md
+                self.xml_stream_tag = "FlexStatement"
+
+    def keep_streamed_element(self, elem):
+        return elem.get("accountId") == self.config["account_number"]
+
+    def read_tree(self, file):
+        if getattr(self, "xml_stream_tag", None):
+            self.flex_index = FlexQueryIndex(super().read_tree(file))
+        else:
+            self.flex_index = FlexQueryIndex.get(file)
+        return self.flex_index.xmltree
+
+    def get_statement_elements(self, section, xml_interpreter=lambda x: x):
+        """Like get_xpath_elements(), for the elements in a section of the configured account's
+        statement, eg: "Trades/Trade". See FlexQueryIndex."""
+        statement = self.flex_index.statements.get(self.config["account_number"], {})
+        for elem in statement.get(section, []):
+            yield xml_interpreter(elem.attrib)
 
     def deep_identify(self, file):
         try:
@@ -133,9 +206,7 @@ class Importer(investments.Importer, xmlreader.Importer):
                 # account number specific matching
                 return any(
                     elem["accountId"] == self.config["account_number"]
-                    for elem in self.get_xpath_elements(
-                        "/FlexQueryResponse/FlexStatements/FlexStatement/AccountInformation"
-                    )
+                    for elem in self.get_statement_elements("AccountInformation")
                 )
             else:
                 # base check: simply ensure this looks like a valid IBKR Flex Query file
@@ -147,9 +218,7 @@ class Importer(investments.Importer, xmlreader.Importer):
     def set_currency(self):
         self.currency = next(
             item["currency"]
-            for item in self.get_xpath_elements(
-                "/FlexQueryResponse/FlexStatements/FlexStatement/AccountInformation"
-            )
+            for item in self.get_statement_elements("AccountInformation")
             if item["accountId"] == self.config["account_number"]
         )
 
@@ -210,44 +279,32 @@ class Importer(investments.Importer, xmlreader.Importer):
         return DictToObject(ofx_dict)
 
     def get_transactions(self):
-        account_id = self.config["account_number"]
-        base_path = f"/FlexQueryResponse/FlexStatements/FlexStatement[@accountId='{account_id}']"
-
-        yield from self.get_xpath_elements(
-            f"{base_path}/Trades/Trade",
+        yield from self.get_statement_elements(
+            "Trades/Trade",
             xml_interpreter=self.xml_trade_interpreter,
         )
-        yield from self.get_xpath_elements(
-            f"{base_path}/CashTransactions/CashTransaction",
+        yield from self.get_statement_elements(
+            "CashTransactions/CashTransaction",
             xml_interpreter=self.xml_cash_interpreter,
         )
-        yield from self.get_xpath_elements(
-            f"{base_path}/Transfers/Transfer",
+        yield from self.get_statement_elements(
+            "Transfers/Transfer",
             xml_interpreter=self.xml_transfer_interpreter,
         )
 
     def get_balance_assertion_date(self):
-        account_id = self.config["account_number"]
-        base_path = f"/FlexQueryResponse/FlexStatements/FlexStatement[@accountId='{account_id}']"
-
-        ac = list(self.get_xpath_elements(f"{base_path}/CashReport/CashReportCurrency"))[0]
+        ac = list(self.get_statement_elements("CashReport/CashReportCurrency"))[0]
         return self.convert_date(ac["toDate"]).date()
 
     def get_available_cash(self, settlement_fund_balance=0):
         """Assumes there's only one cash currency.
         TODO: get investments transaction builder to accept date from get_available_cash
         """
-        account_id = self.config["account_number"]
-        base_path = f"/FlexQueryResponse/FlexStatements/FlexStatement[@accountId='{account_id}']"
-
-        ac = list(self.get_xpath_elements(f"{base_path}/CashReport/CashReportCurrency"))[0]
+        ac = list(self.get_statement_elements("CashReport/CashReportCurrency"))[0]
         return D(ac["slbNetCash"])
 
     def get_balance_positions(self):
-        account_id = self.config["account_number"]
-        base_path = f"/FlexQueryResponse/FlexStatements/FlexStatement[@accountId='{account_id}']"
-
-        for pos in self.get_xpath_elements(f"{base_path}/OpenPositions/OpenPosition"):
+        for pos in self.get_statement_elements("OpenPositions/OpenPosition"):
             balance = {
                 "security": pos["isin"],
                 "units": D(pos["position"]),
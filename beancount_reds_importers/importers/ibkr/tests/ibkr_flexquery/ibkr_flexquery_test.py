@@ -0,0 +1,82 @@
+# flake8: noqa
+
+from os import path
+
+from beancount_reds_importers.importers import ibkr
+from beancount_reds_importers.util import regression_pytest as regtest
+
+fund_data = [
+    ("VTI", "US9229087690", "Vanguard Total Stock Market ETF"),
+    ("BND", "US9219378356", "Vanguard Total Bond Market ETF"),
+]
+
+fund_info = {
+    "fund_data": fund_data,
+    "money_market": [],
+}
+
+
+def build_config(account_number="U1111111", **kwargs):
+    acct = "Assets:Investments:IBKR"
+    root = "Investments"
+    taxability = "Taxable"
+    leaf = "IBKR"
+    config = {
+        "account_number": account_number,
+        "main_account": acct + ":{ticker}",
+        "cash_account": f"{acct}:{{currency}}",
+        "transfer": "Assets:Zero-Sum-Accounts:Transfers:Bank-Account",
+        "dividends": f"Income:{root}:{taxability}:Dividends:{leaf}:{{ticker}}",
+        "interest": f"Income:{root}:{taxability}:Interest:{leaf}:{{ticker}}",
+        "cg": f"Income:{root}:{taxability}:Capital-Gains:{leaf}:{{ticker}}",
+        "capgainsd_lt": f"Income:{root}:{taxability}:Capital-Gains-Distributions:Long:{leaf}:{{ticker}}",
+        "capgainsd_st": f"Income:{root}:{taxability}:Capital-Gains-Distributions:Short:{leaf}:{{ticker}}",
+        "fees": f"Expenses:Fees-and-Charges:Brokerage-Fees:{taxability}:{leaf}",
+        "invexpense": f"Expenses:Expenses:Investment-Expenses:{taxability}:{leaf}",
+        "rounding_error": "Equity:Rounding-Errors:Imports",
+        "fund_info": fund_info,
+        "emit_filing_account_metadata": False,
+    }
+    config.update(kwargs)
+    return config
+
+
+@regtest.with_importer(ibkr.Importer(build_config()))
+@regtest.with_testdir(path.dirname(__file__))
+class TestIBKRFlexQuery(regtest.ImporterTestBase):
+    pass
+
+
+FILE = path.join(path.dirname(__file__), "ibkr_flex_20240331.xml")
+
+
+def extract(importer):
+    assert importer.identify(FILE)
+    return importer.extract(FILE)
+
+
+def test_stream_xml():
+    for account_number in ["U1111111", "U2222222"]:
+        importer = ibkr.Importer(build_config(account_number, stream_xml=True))
+        expected = extract(ibkr.Importer(build_config(account_number)))
+        assert extract(importer) == expected
+        context = importer.file_context(FILE)
+        assert [s.get("accountId") for s in context.xpath("//FlexStatement")] == [account_number]
+
+
+def test_xpath_cache():
+    importer = ibkr.Importer(build_config()).file_context(FILE)
+    importer.identify(FILE)
+    expr = "/FlexQueryResponse/FlexStatements/FlexStatement/AccountInformation"
+    assert importer.xpath(expr) is importer.xpath(expr)
+    assert ibkr.Importer.compile_xpath(expr) is ibkr.Importer.compile_xpath(expr)
+
+
+def test_shared_index():
+    importers = [ibkr.Importer(build_config(a)) for a in ["U1111111", "U2222222"]]
+    extracted = [extract(importer) for importer in importers]
+    first, second = (importer.file_context(FILE) for importer in importers)
+    assert first.flex_index is second.flex_index
+    assert first.currency == second.currency == "USD"
+    assert [e.postings[0].units.currency for e in extracted[1][:2]] == ["BND", "USD"]
+    assert second.get_balance_assertion_date().isoformat() == "2024-03-30"
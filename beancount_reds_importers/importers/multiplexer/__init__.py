@@ -1,6 +1,31 @@
+import contextvars
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from beancount.core import data
 from beangulp import importer
 
+from beancount_reds_importers.libreader import reader
+
+# Set in each worker process by _init_worker(). See Importer.map_importers()
+_worker_importers = None
+
+
+def _init_worker(importers):
+    global _worker_importers
+    _worker_importers = importers
+
+
+def _run_importer(idx, method, filepath, *args):
+    """Call a method of one of the multiplexer's importers. Runs in a worker process."""
+    imp = _worker_importers[idx]
+    if method != "identify":
+        # Importers set themselves up for the file in identify(), which, like anything else done
+        # in a worker, isn't seen by the main process and later workers
+        imp.identify(filepath)
+    result = getattr(imp, method)(filepath, *args)
+    # identify() may return something truthy that can't be sent back, like a re.Match
+    return bool(result) if method == "identify" else result
+
 
 class Importer(importer.Importer):
     """Multiplexer Importer: used when multiple accounts exist in a single input file, which is
@@ -27,11 +52,53 @@ class Importer(importer.Importer):
         ingest()
     ```
 
+    The importers share what they read from the file (see reader.sharing_reads()), so a file is
+    typically parsed once, rather than once per importer. They can also identify and extract the
+    file concurrently, by adding to the multiplexer config:
+
+        'workers': 4,            # default: 1, which runs the importers one after the other
+        'executor': 'process',   # default: 'thread'. 'process' falls back to threads where
+                                 # processes can't be forked (see reader.fork_context())
+
+    Entries are returned in the order of the importers in the config either way.
     """
 
     def __init__(self, config):
         self.config = config
         self.applicable_importers = None
+        self.shared_reads = {}
+
+    def map_importers(self, importers, method, *args):
+        """Return [imp.method(*args) for imp in importers], running them concurrently if configured
+        to. Exceptions are returned in place of results, rather than raised."""
+        workers = min(self.config.get("workers", 1), len(importers))
+        executor = self.config.get("executor", "thread")
+        with reader.sharing_reads(self.shared_reads):
+            if workers <= 1:
+                return [self.run_importer(getattr(imp, method), *args) for imp in importers]
+
+            # Without fork, importers would have to be pickled, so use threads instead
+            mp_context = reader.fork_context() if executor == "process" else None
+            if mp_context:
+                pool = ProcessPoolExecutor(
+                    workers, mp_context=mp_context, initializer=_init_worker, initargs=(importers,)
+                )
+                calls = [(_run_importer, idx, method) for idx in range(len(importers))]
+            else:
+                pool = ThreadPoolExecutor(workers)
+                # Each thread runs in a copy of this context, to share reads with the others
+                calls = [
+                    (contextvars.copy_context().run, getattr(imp, method)) for imp in importers
+                ]
+            with pool:
+                futures = [pool.submit(*call, *args) for call in calls]
+                return [self.run_importer(future.result) for future in futures]
+
+    def run_importer(self, func, *args):
+        try:
+            return func(*args)
+        except Exception as e:
+            return e
 
     def get_applicable_importers(self, filepath):
         """Return a list of importers that identify the file as applicable."""
@@ -39,14 +106,12 @@ class Importer(importer.Importer):
         if self.applicable_importers:
             return self.applicable_importers  # Preserve previously build importer instantiations
 
-        applicable = []
-        for imp in self.config.get("importers", []):
-            try:
-                if imp.identify(filepath):
-                    applicable.append(imp)
-            except Exception:
-                # Optionally log or handle exceptions from an importer
-                continue
+        importers = self.config.get("importers", [])
+        identified = self.map_importers(importers, "identify", filepath)
+        # Exceptions from an importer mean it doesn't apply
+        applicable = [
+            imp for imp, ok in zip(importers, identified) if ok and not isinstance(ok, Exception)
+        ]
         self.applicable_importers = applicable
         return applicable
 
@@ -57,6 +122,7 @@ class Importer(importer.Importer):
         # beangulp, then all previous ones that were instantiated will return True for all
         # subsequent calls
         self.applicable_importers = None
+        self.shared_reads = {}
 
         return bool(self.get_applicable_importers(filepath))
 
@@ -73,7 +139,8 @@ class Importer(importer.Importer):
 
     def date(self, filepath):
         imps = self.get_applicable_importers(filepath)
-        return max((d for d in (imp.date(filepath) for imp in imps) if d), default=None)
+        with reader.sharing_reads(self.shared_reads):
+            return max((d for d in (imp.date(filepath) for imp in imps) if d), default=None)
 
     def filename(self, filepath):
         if self.config.get("filename", None):
@@ -88,8 +155,11 @@ class Importer(importer.Importer):
     def extract(self, filepath, existing=None):
         # Run extract on all applicable importers and merge their outputs.
         extracted = []
-        for imp in self.get_applicable_importers(filepath):
-            extracted += imp.extract(filepath, existing)
+        imps = self.get_applicable_importers(filepath)
+        for entries in self.map_importers(imps, "extract", filepath, existing):
+            if isinstance(entries, Exception):
+                raise entries
+            extracted += entries
         return extracted
 
     def deduplicate(self, entries, existing):
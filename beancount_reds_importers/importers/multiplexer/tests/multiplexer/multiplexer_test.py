@@ -0,0 +1,86 @@
+import multiprocessing
+from os import path
+
+import pytest
+
+from beancount_reds_importers.importers import multiplexer
+from beancount_reds_importers.importers.fidelity import fidelity_all_accounts_csv
+
+FILE = path.join(
+    path.dirname(__file__),
+    "../../../fidelity/tests/fidelity_all_accounts_csv",
+    "fidelity_csv_all_accounts_transactions_20251204.csv",
+)
+
+# The securities in FILE
+fund_info = {
+    "fund_data": [
+        ("BND", "921937835", "VANGUARD TOTAL BOND MARKET"),
+        ("VTEB", "922907746", "VANGUARD TAX EXEMPT BOND"),
+        ("CUSIP96255NBE8", "96255NBE8", "WHEAT RIDGE COLO SALES & USE TAX REV"),
+        ("OSK", "688239201", "OSHKOSH CORP"),
+        ("WM", "94106L109", "WASTE MANAGEMENT INC"),
+        ("JEPI", "46641Q332", "JPMORGAN EQUITY PREMIUM INCOME"),
+        ("VVV", "92047W101", "VALVOLINE INC"),
+        ("ZTS", "98978V103", "ZOETIS INC"),
+        ("CUSIP44244CCF2", "44244CCF2", "HOUSTON TEX UTIL SYS REV"),
+        ("COR", "03073E105", "AMERISOURCEBERGEN CORP"),
+        ("CUSIP412003AD7", "412003AD7", "HARDIN CNTY OHIO ECONOMIC DEV FACS"),
+    ],
+    "money_market": [],
+}
+
+
+def build_config(account_number):
+    acct = f"Assets:Investments:Fidelity:{account_number}"
+    return {
+        "currency": "USD",
+        "account_number": account_number,
+        "main_account": acct + ":{ticker}",
+        "cash_account": acct + ":{currency}",
+        "transfer": "Assets:Zero-Sum-Accounts:Transfers:Bank-Account",
+        "dividends": "Income:Investments:Dividends:Fidelity:{ticker}",
+        "interest": "Income:Investments:Interest:Fidelity:{ticker}",
+        "cg": "Income:Investments:Capital-Gains:Fidelity:{ticker}",
+        "capgainsd_lt": "Income:Investments:Capital-Gains-Distributions:Long:Fidelity:{ticker}",
+        "capgainsd_st": "Income:Investments:Capital-Gains-Distributions:Short:Fidelity:{ticker}",
+        "fees": "Expenses:Fees-and-Charges:Brokerage-Fees:Fidelity",
+        "invexpense": "Expenses:Expenses:Investment-Expenses:Fidelity",
+        "rounding_error": "Equity:Rounding-Errors:Imports",
+        "fund_info": fund_info,
+        "emit_filing_account_metadata": False,
+        "filename_pattern": "fidelity_csv_all_accounts_transactions_.*.csv",
+    }
+
+
+class Importer(fidelity_all_accounts_csv.Importer):
+    reads = 0
+
+    def read_raw(self, file):
+        Importer.reads += 1
+        return super().read_raw(file)
+
+
+def extract(**kwargs):
+    children = [Importer(build_config(a)) for a in ["111111111", "222222222", "333333333"]]
+    importer = multiplexer.Importer({"importers": children, **kwargs})
+    Importer.reads = 0
+    assert importer.identify(FILE)
+    return importer.extract(FILE)
+
+
+def test_shared_reads():
+    entries = extract()
+    assert Importer.reads == 1
+    accounts = {p.account.split(":")[3] for e in entries for p in e.postings}
+    assert {"111111111", "222222222", "333333333"} <= accounts
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_workers(executor):
+    assert extract(workers=3, executor=executor) == extract()
+
+
+def test_process_executor_without_fork(monkeypatch):
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    assert extract(workers=3, executor="process") == extract()
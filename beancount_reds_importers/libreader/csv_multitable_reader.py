@@ -1,6 +1,8 @@
 """csv importer module for beancount to be used along with investment/banking/other importer modules in
 beancount_reds_importers."""
 
+import petl as etl
+
 from beancount_reds_importers.libreader import csvreader
 
 # This is a reader that converts:
@@ -49,6 +51,22 @@ class Importer(csvreader.Importer):
         # Match against rows that contain section titles. Eg: 'section1', 'section2', ...
         return len(row) == 1
 
+    def segment_tables(self, rows):
+        """Split rows into {section title: [header row, data rows...]} in a single pass. Sections
+        with no rows are dropped. If a title repeats, the last section with that title is kept."""
+        tables = {}
+        title, table = None, []
+        for row in rows:
+            if self.is_section_title(row):
+                if table:
+                    tables[title] = table
+                title, table = row[0], []
+            elif title is not None:
+                table.append(row)
+        if table:
+            tables[title] = table
+        return tables
+
     def read_file(self, file):
         # read csv
         # identify and separate out tables
@@ -58,29 +76,17 @@ class Importer(csvreader.Importer):
         if self.file_read_done:
             return
 
-        self.raw_rdr = rdr = self.read_raw(file)
-
-        rdr = rdr.skip(getattr(self, "skip_head_rows", 0))  # chop unwanted file header rows
-        rdr = rdr.head(
-            len(rdr) - getattr(self, "skip_tail_rows", 0) - 1
-        )  # chop unwanted file footer rows
-
-        #     [0, 2, 10] <-- starts
-        # [-1, 1, 9]     <-- ends
-        table_starts = [i for (i, row) in enumerate(rdr) if self.is_section_title(row)] + [
-            len(rdr)
-        ]
-        table_ends = [r - 1 for r in table_starts][1:]
-        table_indexes = zip(table_starts, table_ends)
-
-        # build the dictionary of tables
-        self.alltables = {}
-        for s, e in table_indexes:
-            if s == e:
-                continue
-            table = rdr.skip(s + 1)  # skip past start index and header row
-            table = table.head(e - s - 1)  # chop lines after table section data
-            self.alltables[rdr[s][0]] = table
+        # Read the file once. Everything below works on these rows
+        rows = list(self.read_raw_rows(file))
+        self.raw_rdr = etl.wrap(rows)
+
+        skip_head_rows = getattr(self, "skip_head_rows", 0)
+        skip_tail_rows = getattr(self, "skip_tail_rows", 0)
+        rows = rows[skip_head_rows : len(rows) - skip_tail_rows]  # chop file header/footer rows
+
+        self.alltables = {
+            title: etl.wrap(table) for title, table in self.segment_tables(rows).items()
+        }
 
         for section, table in self.alltables.items():
             table = table.rowlenselect(0, complement=True)  # clean up empty rows
@@ -60,6 +60,53 @@ from beancount_reds_importers.libreader import reader
 #   - numbers are parsed from string and convered into Decimal type. Non-numeric characters like '$' are removed.
 #   - dates are parsed and converted into datetime type.
 # - The table is now ready for use by the importer. petl makes each row available via namedtuples
+# - Finally, the table is materialized in memory (unless self.materialize_table is set to False). petl
+#   tables are lazy: without this, every iteration (get_transactions(), date(), get_security_list(), etc.)
+#   re-reads the file and re-runs all the conversions above
+
+
+# Currency columns often contain '$', ',', etc.
+non_numeric_re = re.compile(r"[^0-9\.-]")
+
+
+def memoize(func):
+    """Cache the results of a single argument converter. Dates and amounts repeat a lot in large
+    files, and parsing them is where most of the time reading those files goes."""
+    results = {}
+
+    def memoized(x):
+        try:
+            return results[x]
+        except KeyError:
+            results[x] = result = func(x)
+            return result
+
+    return memoized
+
+
+class MaterializedTable(etl.Table):
+    """A petl table held in memory, built by iterating over the given table once. Its namedtuples are
+    also built once, and reused."""
+
+    def __init__(self, table):
+        it = iter(table)
+        self.hdr = tuple(next(it, ()))
+        self.rows = [tuple(row) for row in it]
+        self._namedtuples = None
+
+    def __iter__(self):
+        yield self.hdr
+        yield from self.rows
+
+    def __len__(self):
+        return len(self.rows) + 1
+
+    def namedtuples(self, *args, **kwargs):
+        if args or kwargs:
+            return super().namedtuples(*args, **kwargs)
+        if self._namedtuples is None:
+            self._namedtuples = list(super().namedtuples())
+        return self._namedtuples
 
 
 class Importer(reader.Reader, BGImporter):
@@ -104,47 +151,64 @@ class Importer(reader.Reader, BGImporter):
     def prepare_processed_table(self, rdr):
         return rdr
 
-    def convert_columns(self, rdr):
+    def get_column_converters(self, rdr):
+        """Return a {field: converter} dict for the columns in rdr that convert_columns() fixes up."""
+        header = rdr.header()
+        converters = {}
+
         # convert data in transaction types column
-        if "type" in rdr.header():
-            rdr = rdr.convert("type", self.transaction_type_map)
+        if "type" in header:
+            converters["type"] = self.transaction_type_map
 
         # fixup decimals
         decimals = ["units"]
         for i in decimals:
-            if i in rdr.header():
-                rdr = rdr.convert(i, D)
+            if i in header:
+                converters[i] = D
 
         # fixup currencies
+        @memoize
         def remove_non_numeric(x):
-            return re.sub(r"[^0-9\.-]", "", str(x).strip())  # noqa: W605
+            return D(non_numeric_re.sub("", x.strip()))
+
+        def convert_currency(x):
+            return remove_non_numeric(str(x))
 
         currencies = getattr(self, "currency_fields", []) + [
             "unit_price",
             "fees",
             "commission",
-            "fees",
             "total",
             "amount",
             "balance",
         ]
         for i in currencies:
-            if i in rdr.header():
-                rdr = rdr.convert(i, remove_non_numeric)
-                rdr = rdr.convert(i, D)
+            if i in header:
+                converters[i] = convert_currency
 
         # fixup dates
-        def convert_date(d):
-            """Remove spaces and convert to datetime"""
-            if hasattr(self, "date_format"):
+        if hasattr(self, "date_format"):
+
+            @memoize
+            def convert_date(d):
+                """Remove spaces and convert to datetime"""
                 return datetime.datetime.strptime(d.strip(), self.date_format)
-            return parser.isoparse(d)
+
+        else:
+            convert_date = memoize(parser.isoparse)
 
         dates = getattr(self, "date_fields", []) + ["date", "tradeDate", "settleDate"]
         for i in dates:
-            if i in rdr.header():
-                rdr = rdr.convert(i, convert_date)
+            if i in header:
+                converters[i] = convert_date
 
+        return converters
+
+    def convert_columns(self, rdr):
+        # All columns are converted in a single pass over the table
+        converters = self.get_column_converters(rdr)
+        if converters:
+            rdr = rdr.convert(converters)
         return rdr
 
     def read_raw(self, file):
@@ -154,38 +218,71 @@ class Importer(reader.Reader, BGImporter):
             delimiter=getattr(self, "csv_delimiter", ","),
         )
 
-    def skip_until_main_table(self, rdr, col_labels=None):
-        """Skip csv lines until the header line is found."""
-        # TODO: convert this into an 'extract_table()' method that handles the tail as well
-        if not col_labels:
-            if hasattr(self, "column_labels_line"):
-                col_labels = self.column_labels_line.replace('"', "").split(
-                    getattr(self, "csv_delimiter", ",")
-                )
-            else:
-                return rdr
-        skip = None
+    def read_raw_rows(self, file):
+        """Read the rows of the file into memory, unless self.materialize_table is False. Importers
+        of the same kind reading the same file in a reader.sharing_reads() block share them."""
+        if not getattr(self, "materialize_table", True):
+            return self.read_raw(file)
+        key = (
+            type(self).read_raw,
+            file,
+            getattr(self, "file_encoding", None),
+            getattr(self, "csv_delimiter", ","),
+        )
+        return self.shared_read(key, lambda: etl.wrap(list(self.read_raw(file))))
+
+    def get_column_labels(self):
+        if hasattr(self, "column_labels_line"):
+            return self.column_labels_line.replace('"', "").split(
+                getattr(self, "csv_delimiter", ",")
+            )
+        return None
+
+    def find_main_table(self, rdr, col_labels=None):
+        """Find the main table in a single pass over rdr. Returns the index of its header line, and
+        the index of the first blank line after it (None if there isn't one).
+
+        The header line is the one containing each of col_labels (the first line if col_labels is
+        None). We only check if each element in col_labels shows up in the line in the file, and not
+        the other way around. This allows additional fields to show up anywhere, in case the csv
+        format changes. If several lines match, the last one is used, unless self.header_match is
+        set to "first", in which case the scan stops at the end of the first matching table."""
+        labels = set(col_labels) if col_labels else None
+        last_match = getattr(self, "header_match", "last") == "last"
+        header = end = None
         for n, r in enumerate(rdr):
-            # We only check if each element in col_labels shows up in the line in the file, and not
-            # the other way around. This allows additional fields to show up anywhere, case the csv
-            # format changes
-            if all(i in list(r) for i in col_labels):
-                skip = n
-        if skip is None:
+            if labels is None:
+                is_header = n == 0
+            else:
+                is_header = (header is None or last_match) and labels.issubset(r)
+            if is_header:
+                header, end = n, None
+            elif header is not None and end is None and (not r or all(i == "" for i in r)):
+                end = n
+                if not last_match:
+                    break
+        if header is None:
+            if labels is None:
+                return 0, None  # an empty table
             print("Error: expected columns not found:")
             print(col_labels)
             sys.exit(1)
-        return rdr.skip(skip)
+        return header, end
+
+    def skip_until_main_table(self, rdr, col_labels=None):
+        """Skip csv lines until the header line is found."""
+        col_labels = col_labels or self.get_column_labels()
+        if not col_labels:
+            return rdr
+        header, _ = self.find_main_table(rdr, col_labels)
+        return rdr.skip(header)
 
     def extract_table_with_header(self, rdr, col_labels=None):
-        rdr = self.skip_until_main_table(rdr, col_labels)
-        nrows = len(rdr)
-        for n, r in enumerate(rdr):
-            if not r or all(i == "" for i in r):
-                # blank line, terminate
-                nrows = n - 1
-                break
-        rdr = rdr.head(nrows)
+        """Extract the table from its header line until the first blank line (or the end)."""
+        header, end = self.find_main_table(rdr, col_labels or self.get_column_labels())
+        rdr = rdr.skip(header)
+        if end is not None:
+            rdr = rdr.head(end - header - 1)
         return rdr
 
     def skip_until_row_contains(self, rdr, value):
@@ -201,7 +298,7 @@ class Importer(reader.Reader, BGImporter):
     def read_file(self, file):
         if not getattr(self, "file_read_done", False):
             # read file
-            rdr = self.read_raw(file)
+            rdr = self.read_raw_rows(file)
             rdr = self.prepare_raw_file(rdr)
 
             # extract main table
@@ -223,6 +320,8 @@ class Importer(reader.Reader, BGImporter):
             rdr = self.convert_columns(rdr)
             rdr = self.fix_column_names(rdr)
             rdr = self.prepare_processed_table(rdr)
+            if getattr(self, "materialize_table", True):
+                rdr = MaterializedTable(rdr)
             self.rdr = rdr
             self.ifile = file
             self.file_read_done = True
@@ -272,6 +371,6 @@ class Importer(reader.Reader, BGImporter):
         """
         # Read from scratch, as we don't want to throw away headers or footers, which is where our
         # label is likely to be found
-        rdr = self.read_raw(file)
+        rdr = self.read_raw_rows(file)
         rdr = self.prepare_raw_file(rdr)
         return rdr.select(lambda r: r[0] == label)[1]
@@ -2,8 +2,12 @@
 beancount_reds_importers."""
 
 import datetime
+import hashlib
+import mmap
+import re
+import threading
 import warnings
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 from io import StringIO
 
 import ofxparse
@@ -15,6 +19,82 @@ from beancount_reds_importers.libreader import reader
 
 warnings.filterwarnings("ignore", category=XMLParsedAsHTMLWarning)
 
+# Parsed ofx files, shared by every importer instance in this process and keyed by a hash of the
+# file's contents. A typical config has one importer per account number, and beangulp hands each
+# of them the same file, so without this, a file is parsed once per configured account. Parsed
+# objects are shared, and must be treated as read-only by importers.
+OFX_CACHE_MAX_ENTRIES = 16
+_ofx_cache = OrderedDict()
+_ofx_cache_lock = threading.Lock()
+
+
+def clear_ofx_cache():
+    """Drop all parsed ofx files held in the process-wide cache."""
+    with _ofx_cache_lock:
+        _ofx_cache.clear()
+
+
+_ofx_acctid_re = re.compile(rb"<ACCTID>\s*([^<\r\n]*)", re.IGNORECASE)
+_ofx_tag_re = re.compile(r"<(/?)([A-Za-z0-9_.]+)\s*(/?)>")
+
+
+def clean_sgml(sgml_content):
+    """Remove empty tags from SGML content in a single pass over its tags, without building a tree.
+
+    - '<TAG></TAG>' and '<TAG/>' are removed
+    - '<TAG></PARENT>' (an empty element implicitly closed by its parent) loses '<TAG>'
+    - '<TAG>value' leaf elements without an end tag get one, so ofxparse doesn't have to guess
+      which tags are leaves
+
+    This produces what the BeautifulSoup round-trip in clean_sgml_bs4() does, minus the tree.
+    """
+    out = []
+    pos = 0
+    open_tag = None  # last start tag, while nothing but text has followed it
+    for m in _ofx_tag_re.finditer(sgml_content):
+        closing, name, self_closing = m.groups()
+        text = sgml_content[pos : m.start()]
+        pos = m.end()
+        closes_open_tag = closing and open_tag is not None and name.upper() == open_tag.upper()
+
+        if open_tag is not None and closing and not text:
+            out.pop()  # empty element: drop its start tag
+            open_tag = None
+            if closes_open_tag:
+                continue
+
+        out.append(text)
+        if open_tag is not None and text.strip() and not closes_open_tag:
+            out.append(f"</{open_tag}>")
+        open_tag = None
+
+        if self_closing:
+            continue
+        out.append(m.group(0))
+        if not closing:
+            open_tag = name
+
+    out.append(sgml_content[pos:])
+    return "".join(out)
+
+
+def clean_sgml_bs4(sgml_content):
+    """Remove empty tags from SGML content using BeautifulSoup. Slower, but kept as a fallback for
+    files clean_sgml() mishandles."""
+    soup = BeautifulSoup(sgml_content, "html.parser")
+    # Find and remove all empty tags
+    for tag in soup.find_all():
+        if not tag.contents and not tag.attrs:
+            tag.extract()
+    return str(soup)
+
+
+# Selected via the 'ofx_cleanup' config key
+sgml_cleaners = {
+    "stream": clean_sgml,
+    "beautifulsoup": clean_sgml_bs4,
+}
+
 
 class Importer(reader.Reader, BGImporter):
     FILE_EXTS = ["ofx", "qfx"]
@@ -24,6 +104,8 @@ class Importer(reader.Reader, BGImporter):
             self.file = file
             self.ofx_account = None
             self.reader_ready = False
+            if not self.sniff_account_number(file):
+                return
             try:
                 self.ofx = self.read_file(file)
             except ofxparse.OfxParserException:
@@ -40,6 +122,27 @@ class Importer(reader.Reader, BGImporter):
             if self.reader_ready:
                 self.currency = self.ofx_account.statement.currency.upper()
 
+    def sniff_account_number(self, file):
+        """Cheaply check if the configured account number could be in the file, by scanning the raw
+        file for <ACCTID> tags instead of parsing it. Directories typically hold many ofx files
+        for other accounts, and this lets us decline them without a full parse."""
+        if getattr(self, "account_number_field", "account_id") != "account_id":
+            return True  # can't tell without parsing
+        with open(file, "rb") as fh:
+            try:
+                # The file is paged in as it is scanned, up to the first matching <ACCTID>
+                contents = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                return False
+            with contents:
+                return any(
+                    self.match_account_number(
+                        m.group(1).decode("utf-8", errors="replace").strip(),
+                        self.config["account_number"],
+                    )
+                    for m in _ofx_acctid_re.finditer(contents)
+                )
+
     def match_account_number(self, file_account, config_account):
         """We many not want to store entire credit card numbers in our config. Or a given ofx may not contain
         the full account number. Override this method to handle these cases."""
@@ -56,7 +159,8 @@ class Importer(reader.Reader, BGImporter):
 
     def read_file(self, file):
         """
-        Read an SGML file, remove all empty tags, and parse it using ofxparse.OfxParser.
+        Read an SGML file, and return its parsed contents. Parsing is done once per unique file
+        content in this process; see OFX_CACHE_MAX_ENTRIES.
 
         Args:
             file: A file-like object representing the SGML file.
@@ -67,16 +171,25 @@ class Importer(reader.Reader, BGImporter):
         # Read the SGML file content
         with open(file, "r", encoding="utf-8") as fh:
             sgml_content = fh.read()
-        # Preprocess: Remove empty tags using BeautifulSoup
-        soup = BeautifulSoup(sgml_content, "html.parser")
-        # Find and remove all empty tags
-        for tag in soup.find_all():
-            if not tag.contents and not tag.attrs:
-                tag.extract()
-        processed_sgml = str(soup)
-        # Parse the processed SGML content using ofxparse.OfxParser
-        file_like_object = StringIO(processed_sgml)
-        return ofxparse.OfxParser.parse(file_like_object)
+        cleanup = self.config.get("ofx_cleanup", "stream")
+        key = (cleanup, hashlib.sha256(sgml_content.encode("utf-8")).hexdigest())
+
+        with _ofx_cache_lock:
+            if key in _ofx_cache:
+                _ofx_cache.move_to_end(key)
+                return _ofx_cache[key]
+
+        ofx = self.parse_ofx(sgml_content, sgml_cleaners[cleanup])
+
+        with _ofx_cache_lock:
+            _ofx_cache[key] = ofx
+            while len(_ofx_cache) > OFX_CACHE_MAX_ENTRIES:
+                _ofx_cache.popitem(last=False)
+        return ofx
+
+    def parse_ofx(self, sgml_content, cleaner=clean_sgml):
+        """Remove all empty tags from SGML content, and parse it using ofxparse.OfxParser."""
+        return ofxparse.OfxParser.parse(StringIO(cleaner(sgml_content)))
 
     def get_transactions(self):
         yield from self.ofx_account.statement.transactions
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""On-disk cache of the tables and text pdfreader extracts from pdf files.
+
+Extracting tables from a pdf is slow, and is repeated each time a file is identified or extracted.
+When `pdf_cache_dir` is set in an importer's config, pdfreader stores what it extracted from each
+file in that directory, keyed by the file's contents and the importer's extraction settings, and
+skips pdfplumber entirely the next time it reads the same file with the same settings.
+
+The cache is trimmed each time an entry is added: entries older than `pdf_cache_max_age_days`
+(default: 90) are removed, followed by the least recently used ones until the cache is under
+`pdf_cache_max_mb` (default: 100). `reds-pdf-cache purge <dir>` empties it.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import click
+import pdfplumber
+
+# Bump this when the format of what's cached changes
+CACHE_VERSION = 1
+CACHE_EXT = ".json"
+
+
+def cache_key(file, settings):
+    """Hash of the file's contents, the extraction settings, and the pdfplumber version."""
+    h = hashlib.sha256()
+    with open(file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(json.dumps([CACHE_VERSION, pdfplumber.__version__, settings], default=str).encode())
+    return h.hexdigest()
+
+
+def entries(cache_dir):
+    """Yield (path, os.stat_result) for each entry in the cache."""
+    try:
+        it = os.scandir(cache_dir)
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            if entry.name.endswith(CACHE_EXT) and entry.is_file():
+                yield entry.path, entry.stat()
+
+
+def load(cache_dir, key):
+    """Return (tables, meta_text) cached under key, or None."""
+    path = os.path.join(cache_dir, key + CACHE_EXT)
+    try:
+        with open(path, encoding="utf-8") as f:
+            cached = json.load(f)
+        os.utime(path)  # mark as recently used
+    except (OSError, ValueError):
+        return None
+    return cached["tables"], cached["meta_text"]
+
+
+def save(cache_dir, key, tables, meta_text, max_mb=100, max_age_days=90):
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first, so concurrent readers never see a partial entry
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump({"tables": tables, "meta_text": meta_text}, f)
+    os.replace(tmp, os.path.join(cache_dir, key + CACHE_EXT))
+    evict(cache_dir, max_mb, max_age_days)
+
+
+def evict(cache_dir, max_mb, max_age_days):
+    """Remove entries older than max_age_days, then the least recently used ones until the cache
+    is no larger than max_mb."""
+    now = time.time()
+    kept = []
+    for path, st in entries(cache_dir):
+        if now - st.st_mtime > max_age_days * 86400:
+            remove(path)
+        else:
+            kept.append((st.st_mtime, st.st_size, path))
+
+    size = sum(s for _, s, _ in kept)
+    for _, s, path in sorted(kept):
+        if size <= max_mb * 1024 * 1024:
+            break
+        remove(path)
+        size -= s
+
+
+def remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:  # removed by another process
+        pass
+
+
+@click.group()
+def cli():
+    """Manage the on-disk cache of tables extracted from pdf files."""
+
+
+@cli.command()
+@click.argument("cache_dir", type=click.Path(file_okay=False))
+def info(cache_dir):
+    """Show the number of entries in the cache, and its size."""
+    sizes = [st.st_size for _, st in entries(cache_dir)]
+    print(f"{len(sizes)} entries, {sum(sizes) / 1024 / 1024:.1f} MB")
+
+
+@cli.command()
+@click.argument("cache_dir", type=click.Path(file_okay=False))
+@click.option(
+    "--older-than",
+    type=float,
+    default=None,
+    help="Only remove entries not used in this many days. Default: remove all",
+)
+def purge(cache_dir, older_than):
+    """Remove entries from the cache."""
+    removed = 0
+    now = time.time()
+    for path, st in entries(cache_dir):
+        if older_than is None or now - st.st_mtime > older_than * 86400:
+            remove(path)
+            removed += 1
+    print(f"Removed {removed} entries")
+
+
+if __name__ == "__main__":
+    cli()
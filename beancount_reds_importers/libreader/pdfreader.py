@@ -1,9 +1,11 @@
+import warnings
+from concurrent.futures import ProcessPoolExecutor
 from pprint import pformat
 
 import pdfplumber
 import petl as etl
 
-from beancount_reds_importers.libreader import csv_multitable_reader
+from beancount_reds_importers.libreader import csv_multitable_reader, pdf_cache, reader
 
 LEFT = 0
 TOP = 1
@@ -15,6 +17,22 @@ RED = (255, 0, 0)
 PURPLE = (135, 0, 255)
 TRANSPARENT = (0, 0, 0, 0)
 
+# Set in each worker process by _init_worker(). See Importer.extract_pages_in_parallel()
+_worker_importer = None
+_worker_pdfs = {}
+
+
+def _init_worker(importer):
+    global _worker_importer
+    _worker_importer = importer
+
+
+def _extract_page(file, page_idx):
+    """Runs in a worker process. Each worker opens the pdf once."""
+    if file not in _worker_pdfs:
+        _worker_pdfs[file] = pdfplumber.open(file)
+    return _worker_importer.extract_page(page_idx, _worker_pdfs[file].pages[page_idx])
+
 
 class Importer(csv_multitable_reader.Importer):
     """
@@ -40,7 +58,8 @@ class Importer(csv_multitable_reader.Importer):
         Set to 0 to never consider page-broken tables
 
     self.debug: `boolean`
-        When debug is True a few images and text file are generated:
+        Defaults to False. Pages are only rendered to images when debug is True, since rendering is
+        much slower than extracting tables. When debug is True a few images and text file are generated:
             .debug-pdf-metadata-page_#.png
                 shows the text available in self.meta_text with table data blacked out
 
@@ -50,6 +69,17 @@ class Importer(csv_multitable_reader.Importer):
             .debug-pdf-data.txt
                 is a printout of the meta_text and table data found before being processed into petl tables, as well as some generated helper objects to add to new importers or import configs
 
+    self.config["pdf_workers"]: `int`
+        Defaults to 1. Set this in the importer config to extract pages concurrently in that many
+        processes, which speeds up long statements. Results are combined in page order, so the output is
+        the same as when extracting pages one at a time. Pages are extracted one at a time where
+        processes can't be forked (see reader.fork_context())
+
+    self.config["pdf_cache_dir"]: `str`
+        Set this in the importer config to cache the tables and text extracted from each pdf in this
+        directory, so re-reading a file skips table extraction. See pdf_cache.py. Not used (with a warning) in
+        debug mode
+
     self.transaction_table_section: `str`
         When reading a pdf that contains transactions, set this setting to the name of the table section that
         contains the transactions. This is the key for the table in the self.alltables dictionary.
@@ -116,9 +146,10 @@ class Importer(csv_multitable_reader.Importer):
         """Extract tables from a page within the given crop area."""
         cropped_page = page.crop(adjusted_crop)
 
-        image = page.crop(adjusted_crop).to_image()  # debug
-        image.debug_tablefinder(self.pdf_table_extraction_settings)  # debug
-        self.debug_images[page_idx] = image  # debug
+        if self.is_debug():  # rendering pages is expensive; only do it when debugging
+            image = cropped_page.to_image()  # debug
+            image.debug_tablefinder(self.pdf_table_extraction_settings)  # debug
+            self.debug_images[page_idx] = image  # debug
 
         table_refs = cropped_page.find_tables(table_settings=self.pdf_table_extraction_settings)
 
@@ -127,20 +158,21 @@ class Importer(csv_multitable_reader.Importer):
     def extract_metadata(self, page_idx, page, tables):
         """Extract metadata text outside of table bounding boxes."""
         meta_page = page
-        meta_image = meta_page.to_image()  # debug
+        meta_image = meta_page.to_image() if self.is_debug() else None  # debug
 
         for table in tables:
             meta_page = meta_page.outside_bbox(table["bbox"])
-            meta_image.draw_rect(table["bbox"], BLACK, RED)  # debug
+            if meta_image:
+                meta_image.draw_rect(table["bbox"], BLACK, RED)  # debug
 
-        if self.debug:
+        if meta_image:
             meta_image.save(".debug-pdf-metadata-page_{}.png".format(page_idx))  # debug
 
         return meta_page.extract_text()
 
     def attach_section_headers(self, page_idx, page_tables, page):
         """Attach section headers to tables."""
-        image = self.debug_images[page_idx]  # debug
+        image = self.debug_images.get(page_idx)  # debug
 
         for table_idx, table in enumerate(page_tables):
             section_title_bbox = (
@@ -153,7 +185,8 @@ class Importer(csv_multitable_reader.Importer):
             bbox_area = pdfplumber.utils.calculate_area(section_title_bbox)
             if bbox_area > 0:
                 section_title = page.crop(section_title_bbox).extract_text()
-                image.draw_rect(section_title_bbox, TRANSPARENT, PURPLE)  # debuglogic
+                if image:
+                    image.draw_rect(section_title_bbox, TRANSPARENT, PURPLE)  # debuglogic
                 page_tables[table_idx]["section"] = section_title
             else:
                 page_tables[table_idx]["section"] = ""
@@ -164,6 +197,28 @@ class Importer(csv_multitable_reader.Importer):
 
         return page_tables
 
+    def extract_page(self, page_idx, page):
+        """Extract the tables (with their section headers) and the metadata text from a page."""
+        adjusted_crop = self.get_adjusted_crop(page_idx, page)
+        page_tables = self.extract_tables(page_idx, page, adjusted_crop)
+        meta_text = self.extract_metadata(page_idx, page, page_tables)
+        page_tables = self.attach_section_headers(page_idx, page_tables, page)
+
+        if self.is_debug():
+            self.debug_images[page_idx].save(
+                ".debug-pdf-table-detection-page_{}.png".format(page_idx)
+            )  # debug
+
+        return page_tables, meta_text
+
+    def extract_pages_in_parallel(self, file, num_pages, workers, mp_context):
+        """Run extract_page() for each page in a pool of worker processes. Returns the results in page
+        order. Workers are forked, so they inherit this importer as is."""
+        with ProcessPoolExecutor(
+            workers, mp_context=mp_context, initializer=_init_worker, initargs=(self,)
+        ) as executor:
+            return list(executor.map(_extract_page, [file] * num_pages, range(num_pages)))
+
     def find_and_fix_broken_tables(self, tables):
         """Combine tables that are split up by page breaks."""
         for table_idx, table in enumerate(tables[:]):
@@ -189,8 +244,11 @@ class Importer(csv_multitable_reader.Importer):
 
         return tables
 
+    def is_debug(self):
+        return getattr(self, "debug", False)
+
     def generate_debug_helpers(self, tables):
-        if self.debug:
+        if self.is_debug():
             paycheck_template = {}
             header_map = {}
             for table in tables:
@@ -226,30 +284,68 @@ class Importer(csv_multitable_reader.Importer):
             return
 
         self.meta_text = ""
-        tables = []
-
-        with pdfplumber.open(file) as pdf:
-            for page_idx, page in enumerate(pdf.pages):
-                adjusted_crop = self.get_adjusted_crop(page_idx, page)
-                page_tables = self.extract_tables(page_idx, page, adjusted_crop)
-                self.meta_text += self.extract_metadata(page_idx, page, page_tables)
-                page_tables = self.attach_section_headers(page_idx, page_tables, page)
-
-                if self.debug:
-                    self.debug_images[page_idx].save(
-                        ".debug-pdf-table-detection-page_{}.png".format(page_idx)
-                    )  # debug
-
-                tables.extend(page_tables)
-
-        tables = self.find_and_fix_broken_tables(tables)
+        cache_dir = self.config.get("pdf_cache_dir")
+        if cache_dir and self.is_debug():
+            # Debug output is generated while extracting tables, so a cache hit would skip it
+            warnings.warn(
+                f"pdf_cache_dir ({cache_dir}) is not used while debug is on", stacklevel=2
+            )
+            cache_dir = None
+        cached = None
+        if cache_dir:
+            key = pdf_cache.cache_key(file, self.get_cache_settings())
+            cached = pdf_cache.load(cache_dir, key)
+
+        if cached:
+            tables, self.meta_text = cached
+        else:
+            tables = self.extract_all_tables(file)
+            if cache_dir:
+                pdf_cache.save(
+                    cache_dir,
+                    key,
+                    tables,
+                    self.meta_text,
+                    self.config.get("pdf_cache_max_mb", 100),
+                    self.config.get("pdf_cache_max_age_days", 90),
+                )
         self.generate_debug_helpers(tables)  # debug
 
         self.alltables = {table["section"]: etl.wrap(table["table"]) for table in tables}
         self.prepare_tables()
 
-        if self.debug:  # debug
+        if self.is_debug():  # debug
             with open(".debug-pdf-prepared-tables.txt", "w") as debug_file:
                 debug_file.write(pformat({"prepared_tables": self.alltables}))
 
         self.file_read_done = True
+
+    def get_cache_settings(self):
+        """Everything besides the file's contents that determines what extract_all_tables() returns.
+        Override this if your importer's extraction depends on anything else."""
+        return [
+            f"{type(self).__module__}.{type(self).__qualname__}",
+            self.pdf_table_extraction_settings,
+            self.pdf_table_extraction_crop,
+            self.pdf_table_title_height,
+            self.pdf_page_break_top,
+        ]
+
+    def extract_all_tables(self, file):
+        """Extract the tables from all pages, and the text outside them into self.meta_text."""
+        tables = []
+        with pdfplumber.open(file) as pdf:
+            workers = min(self.config.get("pdf_workers", 1), len(pdf.pages))
+            mp_context = reader.fork_context() if workers > 1 else None
+            if mp_context:
+                pages = self.extract_pages_in_parallel(file, len(pdf.pages), workers, mp_context)
+            else:
+                pages = (
+                    self.extract_page(page_idx, page) for page_idx, page in enumerate(pdf.pages)
+                )
+
+            for page_tables, meta_text in pages:
+                self.meta_text += meta_text
+                tables.extend(page_tables)
+
+        return self.find_and_fix_broken_tables(tables)
@@ -1,14 +1,177 @@
 """Reader module base class for beancount_reds_importers. ofx, csv, etc. readers inherit this."""
 
+import contextlib
+import contextvars
+import copy
+import functools
+import multiprocessing
 import ntpath
+import os
 import re
+import sys
+import threading
+import types
+from collections import OrderedDict
 from os import path
 
+# Number of files for which an importer instance keeps its per-file state around
+FILE_CONTEXTS_MAX = 8
+_file_contexts_lock = threading.Lock()
+
+# Whether account() is being called by smart_importer's predictor. None means detect it. See
+# Reader.account()
+_predicting_postings = contextvars.ContextVar("predicting_postings", default=None)
+
+
+@contextlib.contextmanager
+def predicting_postings(predicting=True):
+    """Tell importers whether account() calls in this block come from smart_importer's predictor,
+    instead of having them detect it. Eg, in a custom hook:
+
+        with reader.predicting_postings():
+            account = importer.account(file)
+    """
+    token = _predicting_postings.set(predicting)
+    try:
+        yield
+    finally:
+        _predicting_postings.reset(token)
+
+
+# What importers read in a sharing_reads() block: {key: value}. See Reader.shared_read()
+_shared_reads = contextvars.ContextVar("shared_reads", default=None)
+_shared_reads_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def sharing_reads(reads=None):
+    """Have importers share what they read from files in this block, instead of each reading the
+    file itself. Used by the multiplexer importer, whose importers all read the same file. Pass a
+    dict to keep what was read across blocks."""
+    token = _shared_reads.set({} if reads is None else reads)
+    try:
+        yield
+    finally:
+        _shared_reads.reset(token)
+
+
+def fork_context():
+    """Return the multiprocessing context to fork worker processes with, or None if they can't be
+    forked: on platforms that can't fork, and while other threads are running, since a forked
+    process only gets the calling thread, and locks held by the others stay locked in it."""
+    if "fork" not in multiprocessing.get_all_start_methods() or threading.active_count() > 1:
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def called_by_predictor():
+    """Whether smart_importer's predictor is on the call stack. Only looks at the file name of each
+    frame's code, which is cheap, unlike inspect.getouterframes(), which reads source files."""
+    predicting = _predicting_postings.get()
+    if predicting is not None:
+        return predicting
+    frame = sys._getframe(1)
+    while frame is not None:
+        if "predictor" in frame.f_code.co_filename:
+            return True
+        frame = frame.f_back
+    return False
+
+
+def per_file(method):
+    """Run a beangulp entry point on the importer's context for the file it is called with. See
+    Reader.file_context()."""
+
+    @functools.wraps(method)
+    def wrapper(self, file, *args, **kwargs):
+        if getattr(self, "is_file_context", False):
+            return method(self, file, *args, **kwargs)
+        context = self.file_context(file)
+        with context.file_context_lock:
+            return method(context, file, *args, **kwargs)
+
+    wrapper.per_file = True
+    return wrapper
+
 
 class Reader:
     FILE_EXTS = [""]
     IMPORTER_NAME = "NOT SET"
 
+    # beangulp entry points, which are run on a per-file context. See file_context()
+    PER_FILE_METHODS = ("identify", "account", "date", "filename", "extract")
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Wrap entry points, including those overridden by importers, and those inherited from
+        # transaction builders. Wrappers a base class installed for methods it merely inherited
+        # are skipped in the search, as they may hide a transaction builder's method that comes
+        # earlier in this class' MRO.
+        for name in cls.PER_FILE_METHODS:
+            owner, method = next(
+                (
+                    (c, c.__dict__[name])
+                    for c in cls.__mro__
+                    if name in c.__dict__ and not getattr(c.__dict__[name], "inherited", False)
+                ),
+                (None, None),
+            )
+            if method is None:
+                continue
+            if not getattr(method, "per_file", False):
+                method = per_file(method)
+                method.inherited = owner is not cls
+            if cls.__dict__.get(name) is not method:
+                setattr(cls, name, method)
+
+    def file_context(self, file):
+        """Return the context holding all state for processing file with this importer.
+
+        Readers and transaction builders keep per-file state on self (self.file, self.rdr,
+        self.ofx_account, self.alltables, self.initialized, etc.). So that a single importer
+        instance can work on several files, interleaved or concurrently, beangulp's entry points
+        (PER_FILE_METHODS) run on a shallow copy of the importer specific to the file, rather than
+        on the importer itself. Contexts are keyed by path and mtime, so the calls beangulp makes
+        in sequence for a file (identify, account, date, filename, extract) share one context and
+        read the file once, and a file modified in between is read afresh.
+        """
+        try:
+            key = (file, os.stat(file).st_mtime_ns)
+        except OSError:
+            key = (file, None)
+
+        with _file_contexts_lock:
+            contexts = self.__dict__.setdefault("_file_contexts", OrderedDict())
+            if key in contexts:
+                contexts.move_to_end(key)
+                return contexts[key]
+
+            context = copy.copy(self)
+            del context.__dict__["_file_contexts"]
+            # Methods bound to self in custom_init() must be rebound to the context
+            for k, v in context.__dict__.items():
+                if isinstance(v, types.MethodType) and v.__self__ is self:
+                    setattr(context, k, types.MethodType(v.__func__, context))
+            context.is_file_context = True
+            context.file_context_lock = threading.RLock()
+
+            contexts[key] = context
+            while len(contexts) > FILE_CONTEXTS_MAX:
+                contexts.popitem(last=False)
+            return context
+
+    def shared_read(self, key, read):
+        """Return read(). In a sharing_reads() block, read() is only called for the first importer
+        asking for key, and what it returned is shared with the others. read() must then return
+        something that can be used by several importers (and threads) at once."""
+        reads = _shared_reads.get()
+        if reads is None:
+            return read()
+        with _shared_reads_lock:
+            if key not in reads:
+                reads[key] = read()
+            return reads[key]
+
     def identify(self, file):
         # quick check to filter out files that are not the right format
         # print()
@@ -39,13 +202,9 @@ class Reader:
         # https://github.com/redstreet/beancount_reds_importers/issues/41
         # https://github.com/beancount/smart_importer/issues/122
         # https://github.com/beancount/smart_importer/issues/30
-        import inspect
-
-        curframe = inspect.currentframe()
-        calframe = inspect.getouterframes(curframe, 2)
-        if any("predictor" in i.filename for i in calframe):
-            if "smart_importer_hack" in self.config:
-                return self.config["smart_importer_hack"]
+        # Importers not configured with the hack don't pay for looking up the call stack
+        if "smart_importer_hack" in self.config and called_by_predictor():
+            return self.config["smart_importer_hack"]
 
         # Otherwise handle a typical bean-file call
         self.initialize(file)
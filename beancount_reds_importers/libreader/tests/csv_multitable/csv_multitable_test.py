@@ -0,0 +1,53 @@
+import petl as etl
+
+from beancount_reds_importers.libreader import csv_multitable_reader
+
+CSV = """downloaded on: blah blah
+section1
+date,transactions,amount
+2020-02-02,3,5.00
+2020-02-03,4,6.00
+empty_section
+section2
+account_num,balance,date
+123123,1000,2020-12-31
+section1
+date,transactions,amount
+2020-02-04,5,7.00
+section3
+account_num,balance,date
+23048,2000,2020-12-31
+end_of_file
+"""
+
+
+class Importer(csv_multitable_reader.Importer):
+    def prepare_tables(self):
+        pass
+
+
+def old_segment_tables(rdr):
+    """How read_file used to split the file into sections"""
+    table_starts = [i for (i, row) in enumerate(rdr) if len(row) == 1] + [len(rdr)]
+    table_ends = [r - 1 for r in table_starts][1:]
+    alltables = {}
+    for s, e in zip(table_starts, table_ends):
+        if s == e:
+            continue
+        alltables[rdr[s][0]] = rdr.skip(s + 1).head(e - s - 1)
+    return alltables
+
+
+def test_same_as_old_segmentation(tmp_path):
+    file = tmp_path / "multitable.csv"
+    file.write_text(CSV)
+    importer = Importer()
+    importer.file_read_done = False
+    importer.skip_tail_rows = 1
+    importer.read_file(str(file))
+
+    rdr = etl.fromcsv(str(file))
+    expected = old_segment_tables(rdr.head(len(rdr) - 2))
+    assert list(importer.alltables) == list(expected) == ["section1", "section2", "section3"]
+    for section, table in expected.items():
+        assert list(importer.alltables[section]) == list(table)
@@ -0,0 +1,91 @@
+"""Tests for per-file importer contexts (reader.Reader.file_context), which let a single importer
+instance work on several files, interleaved or concurrently."""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+from beancount.parser import printer
+
+from beancount_reds_importers.importers import vanguard
+
+QFX = path.join(
+    path.dirname(__file__),
+    "..",
+    "..",
+    "..",
+    "importers",
+    "vanguard",
+    "tests",
+    "OfxDownload-401k.qfx",
+)
+
+
+def make_importer():
+    return vanguard.Importer(
+        {
+            "account_number": "444555",
+            "main_account": "Assets:Vanguard:401k:{source401k}:{ticker}",
+            "cash_account": "Assets:Vanguard:401k:Cash",
+            "dividends": "Income:Dividends:Vanguard:401k:{source401k}:{ticker}",
+            "interest": "Income:Interest:Vanguard:401k:{source401k}:{ticker}",
+            "cg": "Income:CapitalGains:401k:{source401k}:{ticker}",
+            "capgainsd_lt": "Income:CapitalGains:Long:Vanguard:401k:{source401k}:{ticker}",
+            "capgainsd_st": "Income:CapitalGains:Short:Vanguard:401k:{source401k}:{ticker}",
+            "fees": "Expenses:Fees:Vanguard:401k",
+            "invexpense": "Expenses:Expenses:Vanguard:401k",
+            "rounding_error": "Equity:Rounding-Errors:Imports",
+            "fund_info": {
+                "fund_data": [("V7743", "VGI007743", "Vanguard Target Retirement 2050 Trust")],
+                "money_market": ["VMFXX"],
+            },
+        }
+    )
+
+
+def copy_qfx(tmp_path, name, replace=None):
+    with open(QFX, encoding="utf-8") as f:
+        contents = f.read()
+    if replace:
+        contents = contents.replace(*replace)
+    fn = str(tmp_path / name)
+    with open(fn, "w", encoding="utf-8") as f:
+        f.write(contents)
+    return fn
+
+
+def extracted(importer, file):
+    return "".join(printer.format_entry(e) for e in importer.extract(file, []))
+
+
+def test_interleaved_files(tmp_path):
+    a = copy_qfx(tmp_path, "OfxDownload-a.qfx")
+    b = copy_qfx(tmp_path, "OfxDownload-b.qfx", ("444555", "999999"))
+    importer = make_importer()
+    assert importer.identify(a)
+    assert not importer.identify(b)
+    assert importer.account(a) == "Assets:Vanguard:401k"
+    assert extracted(importer, a) == extracted(make_importer(), a)
+    assert importer.file_context(a) is not importer.file_context(b)
+
+
+def test_concurrent_files(tmp_path):
+    files = [copy_qfx(tmp_path, "OfxDownload-a.qfx")] + [
+        copy_qfx(tmp_path, f"OfxDownload-{i}.qfx", ("<MEMO>", f"<MEMO>{i} ")) for i in range(4)
+    ]
+    expected = [extracted(make_importer(), f) for f in files]
+    importer = make_importer()
+    with ThreadPoolExecutor(4) as executor:
+        assert list(executor.map(lambda f: extracted(importer, f), files * 2)) == expected * 2
+
+
+def test_modified_file_gets_new_context(tmp_path):
+    a = copy_qfx(tmp_path, "OfxDownload-a.qfx")
+    importer = make_importer()
+    context = importer.file_context(a)
+    assert importer.file_context(a) is context
+    shutil.copy(QFX, a)
+    stat = os.stat(a)
+    os.utime(a, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert importer.file_context(a) is not context
@@ -0,0 +1,59 @@
+import petl as etl
+
+from beancount_reds_importers.libreader import csvreader
+
+ROWS = [
+    ["Statement for account 123"],
+    ["Date", "Amount", "Memo"],
+    ["2024-01-01", "1.00", "a"],
+    [],
+    ["Pending"],
+    ["Date", "Amount", "Memo", "Extra"],
+    ["2024-01-02", "2.00", "b", "x"],
+    ["2024-01-03", "3.00", "c", "y"],
+    ["", "", "", ""],
+    ["Totals", "5.00"],
+]
+
+
+class Importer(csvreader.Importer):
+    column_labels_line = "Date,Amount"
+
+
+def rows(table):
+    return [list(r) for r in table]
+
+
+def extract(header_match=None, col_labels=None):
+    importer = Importer()
+    if header_match:
+        importer.header_match = header_match
+    return rows(importer.extract_table_with_header(etl.wrap(ROWS), col_labels))
+
+
+def test_last_match():
+    assert extract() == [ROWS[5], ROWS[6], ROWS[7]]
+
+
+def test_first_match():
+    assert extract("first") == [ROWS[1], ROWS[2]]
+
+
+def test_col_labels():
+    assert extract(col_labels=["Extra"]) == [ROWS[5], ROWS[6], ROWS[7]]
+
+
+def test_skip_until_main_table():
+    importer = Importer()
+    assert rows(importer.skip_until_main_table(etl.wrap(ROWS))) == ROWS[5:]
+    importer.header_match = "first"
+    assert rows(importer.skip_until_main_table(etl.wrap(ROWS))) == ROWS[1:]
+
+
+def test_no_blank_line():
+    assert rows(Importer().extract_table_with_header(etl.wrap(ROWS[:3]))) == ROWS[1:3]
+
+
+def test_empty_table():
+    importer = csvreader.Importer()
+    assert rows(importer.extract_table_with_header(etl.wrap([]))) == []
@@ -0,0 +1,59 @@
+from os import path
+
+from beancount.parser import printer
+
+from beancount_reds_importers.importers.schwab import schwab_csv_checking
+from beancount_reds_importers.libreader import csvreader
+
+CSV = path.join(
+    path.dirname(__file__),
+    "../../../importers/schwab/tests/schwab_csv_checking",
+    "schwab_XXX234_Checking_Transactions_20220203.csv",
+)
+
+
+def make_importer():
+    importer = schwab_csv_checking.Importer(
+        {
+            "account_number": "1234",
+            "main_account": "Assets:Banks:Schwab",
+            "currency": "USD",
+            "emit_filing_account_metadata": False,
+        }
+    )
+    assert importer.identify(CSV)
+    return importer
+
+
+def extract(importer):
+    return "".join(printer.format_entry(e) for e in importer.extract(CSV, []))
+
+
+def test_file_read_once(monkeypatch):
+    reads = []
+    read_raw = csvreader.Importer.read_raw
+
+    def counting_read_raw(self, file):
+        rdr = read_raw(self, file)
+        return rdr.addfield("counted", lambda rec: reads.append(1))
+
+    monkeypatch.setattr(csvreader.Importer, "read_raw", counting_read_raw)
+    importer = make_importer()
+    importer.extract(CSV, [])
+    rows = len(reads)
+    importer.date(CSV)
+    importer.extract(CSV, [])
+    assert rows and len(reads) == rows
+
+
+def test_namedtuples_reused():
+    importer = make_importer().file_context(CSV)
+    importer.read_file(CSV)
+    assert isinstance(importer.rdr, csvreader.MaterializedTable)
+    assert importer.rdr.namedtuples() is importer.rdr.namedtuples()
+
+
+def test_same_as_lazy():
+    lazy = make_importer()
+    lazy.materialize_table = False
+    assert extract(make_importer()) == extract(lazy)
@@ -0,0 +1,125 @@
+"""Tests for ofxreader: the process-wide parsed ofx cache and cheap account number sniffing."""
+
+import os
+from os import path
+
+import pytest
+
+from beancount_reds_importers.importers import vanguard
+from beancount_reds_importers.libreader import ofxreader
+
+QFX = path.join(
+    path.dirname(__file__),
+    "..",
+    "..",
+    "..",
+    "importers",
+    "vanguard",
+    "tests",
+    "OfxDownload-401k.qfx",
+)
+
+
+def make_importer(account_number):
+    return vanguard.Importer(
+        {
+            "account_number": account_number,
+            "main_account": "Assets:Vanguard:{ticker}",
+            "fund_info": {"fund_data": [], "money_market": []},
+        }
+    )
+
+
+def count_parses(monkeypatch):
+    calls = []
+    parse_ofx = ofxreader.Importer.parse_ofx
+
+    def counting_parse_ofx(self, *args):
+        calls.append(1)
+        return parse_ofx(self, *args)
+
+    monkeypatch.setattr(ofxreader.Importer, "parse_ofx", counting_parse_ofx)
+    return calls
+
+
+def test_file_parsed_once_across_importers(monkeypatch):
+    ofxreader.clear_ofx_cache()
+    calls = count_parses(monkeypatch)
+    importers = [make_importer("444555") for _ in range(3)]
+    assert all(imp.identify(QFX) for imp in importers)
+    assert len(calls) == 1
+    assert importers[0].file_context(QFX).ofx is importers[1].file_context(QFX).ofx
+
+
+def test_cache_is_bounded(monkeypatch):
+    ofxreader.clear_ofx_cache()
+    calls = count_parses(monkeypatch)
+    monkeypatch.setattr(ofxreader, "OFX_CACHE_MAX_ENTRIES", 0)
+    make_importer("444555").identify(QFX)
+    make_importer("444555").identify(QFX)
+    assert len(calls) == 2
+    assert len(ofxreader._ofx_cache) == 0
+
+
+def test_identify_declines_other_accounts_without_parsing(monkeypatch):
+    ofxreader.clear_ofx_cache()
+    calls = count_parses(monkeypatch)
+    assert not make_importer("111111").identify(QFX)
+    assert len(calls) == 0
+    assert make_importer("444555").identify(QFX)
+    assert len(calls) == 1
+
+
+PACKAGE_DIR = path.join(path.dirname(__file__), "..", "..", "..")
+OFX_FILES = sorted(
+    path.relpath(path.join(root, f), PACKAGE_DIR)
+    for root, _, files in os.walk(PACKAGE_DIR)
+    for f in files
+    if f.lower().endswith((".ofx", ".qfx"))
+)
+
+
+def as_data(obj):
+    """Parsed ofx objects as comparable lists, dicts, and values"""
+    if isinstance(obj, (list, tuple)):
+        return [as_data(x) for x in obj]
+    if isinstance(obj, dict):
+        return {k: as_data(v) for k, v in obj.items()}
+    if hasattr(obj, "__dict__"):
+        return {"__class__": type(obj).__name__, **as_data(vars(obj))}
+    return obj
+
+
+@pytest.mark.parametrize("file", OFX_FILES)
+def test_clean_sgml_same_as_bs4(file):
+    with open(path.join(PACKAGE_DIR, file), encoding="utf-8") as fh:
+        sgml_content = fh.read()
+    importer = make_importer("444555")
+    stream = importer.parse_ofx(sgml_content, ofxreader.clean_sgml)
+    bs4 = importer.parse_ofx(sgml_content, ofxreader.clean_sgml_bs4)
+    assert as_data(stream.accounts) == as_data(bs4.accounts)
+
+
+@pytest.mark.parametrize(
+    "sgml, expected",
+    [
+        ("<A><B></A>", "<A></A>"),  # empty element closed by its parent
+        ("<A><B/><C>1</C></A>", "<A><C>1</C></A>"),
+        ("<A><B></B><C>x</A>", "<A><C>x</C></A>"),
+        ("<A><B>1<C>2</A>", "<A><B>1</B><C>2</C></A>"),  # unterminated leaves
+        ("<A>\n<B>1\n</A>", "<A>\n<B>1\n</B></A>"),
+    ],
+)
+def test_clean_sgml(sgml, expected):
+    assert ofxreader.clean_sgml(sgml) == expected
+
+
+def test_sniff_account_number(tmp_path):
+    importer = make_importer("444555")
+    assert importer.sniff_account_number(QFX)
+    empty = tmp_path / "empty.qfx"
+    empty.write_bytes(b"")
+    assert not importer.sniff_account_number(str(empty))
+    other = tmp_path / "other.qfx"
+    other.write_bytes(b"<ACCTID>111111\n<ACCTID>444555\n")
+    assert importer.sniff_account_number(str(other))
@@ -0,0 +1,106 @@
+import os
+import threading
+from os import path
+
+import pdfplumber
+import pytest
+
+from beancount_reds_importers.importers import genericpdfpaycheck, mercurycards
+from beancount_reds_importers.libreader import pdf_cache
+
+PDF = path.join(
+    path.dirname(__file__),
+    "../../../importers/mercurycards/tests/mercury_statement_20241105.pdf",
+)
+
+
+def read(workers):
+    importer = mercurycards.Importer(
+        {"main_account": "Liabilities:Mercury", "currency": "USD", "pdf_workers": workers}
+    )
+    importer.initialize(PDF)
+    importer.read_file(PDF)
+    return importer
+
+
+def test_parallel_same_as_sequential():
+    sequential, parallel = read(1), read(4)
+    assert parallel.meta_text == sequential.meta_text
+    assert list(parallel.alltables) == list(sequential.alltables)
+    for section, table in sequential.alltables.items():
+        assert list(parallel.alltables[section]) == list(table)
+
+
+def test_no_fork_while_threads_run(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("forked while another thread was running")
+
+    monkeypatch.setattr(mercurycards.Importer, "extract_pages_in_parallel", fail)
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        parallel = read(4)
+    finally:
+        stop.set()
+        thread.join()
+    sequential = read(1)
+    for section, table in sequential.alltables.items():
+        assert list(parallel.alltables[section]) == list(table)
+
+
+def test_cache(tmp_path, monkeypatch):
+    def read_cached():
+        importer = mercurycards.Importer(
+            {"main_account": "Liabilities:Mercury", "currency": "USD", "pdf_cache_dir": tmp_path}
+        )
+        importer.initialize(PDF)
+        importer.read_file(PDF)
+        return importer
+
+    uncached = read(1)
+    first = read_cached()
+    assert len(list(pdf_cache.entries(tmp_path))) == 1
+
+    def fail(*args, **kwargs):
+        raise AssertionError("pdf was re-read")
+
+    monkeypatch.setattr(pdfplumber, "open", fail)
+    second = read_cached()
+    for importer in (first, second):
+        assert importer.meta_text == uncached.meta_text
+        for section, table in uncached.alltables.items():
+            assert list(importer.alltables[section]) == list(table)
+
+
+PAYSTUB = path.join(
+    path.dirname(__file__), "../../../importers/genericpdfpaycheck/tests/paystub.sample.pdf"
+)
+
+
+@pytest.mark.parametrize("debug", [False, True])
+def test_cache_debug(tmp_path, monkeypatch, debug):
+    monkeypatch.chdir(tmp_path)
+    cache_dir = tmp_path / "cache"
+    importer = genericpdfpaycheck.Importer(
+        {"paycheck_template": {}, "currency": "USD", "pdf_cache_dir": cache_dir, "debug": debug}
+    )
+    importer.initialize(PAYSTUB)
+    if debug:
+        with pytest.warns(UserWarning, match="pdf_cache_dir"):
+            importer.read_file(PAYSTUB)
+    else:
+        importer.read_file(PAYSTUB)
+    assert len(list(pdf_cache.entries(cache_dir))) == (0 if debug else 1)
+    assert any(f.name.startswith(".debug-pdf-") for f in tmp_path.iterdir()) == debug
+
+
+def test_cache_eviction(tmp_path):
+    for i in range(3):
+        entry = tmp_path / f"{i}.json"
+        entry.write_text("x" * 1024 * 1024)
+        os.utime(entry, (i, i))  # 0.json is the least recently used
+    pdf_cache.evict(tmp_path, max_mb=2, max_age_days=1e9)
+    assert sorted(path.basename(p) for p, _ in pdf_cache.entries(tmp_path)) == ["1.json", "2.json"]
+    pdf_cache.evict(tmp_path, max_mb=100, max_age_days=1)
+    assert list(pdf_cache.entries(tmp_path)) == []
@@ -0,0 +1,36 @@
+from os import path
+
+from beancount_reds_importers.importers import ally
+from beancount_reds_importers.libreader import reader
+
+QFX = path.join(path.dirname(__file__), "../../../importers/ally/tests/transactions.qfx")
+
+# Stands in for smart_importer's predictor module, which Reader.account() looks for on the stack
+PREDICTOR = """
+def predict(importer, file):
+    return importer.account(file)
+"""
+predictor = {}
+exec(compile(PREDICTOR, "smart_importer/predictor.py", "exec"), predictor)  # noqa: S102
+
+
+def make_importer(**config):
+    return ally.Importer({"account_number": "23456", "main_account": "Assets:Ally", **config})
+
+
+def test_hack_used_by_predictor():
+    importer = make_importer(smart_importer_hack="Assets:Hack")
+    assert importer.account(QFX) == "Assets:Ally"
+    assert predictor["predict"](importer, QFX) == "Assets:Hack"
+
+
+def test_hack_not_configured():
+    assert predictor["predict"](make_importer(), QFX) == "Assets:Ally"
+
+
+def test_explicit_flag():
+    importer = make_importer(smart_importer_hack="Assets:Hack")
+    with reader.predicting_postings():
+        assert importer.account(QFX) == "Assets:Hack"
+    with reader.predicting_postings(False):
+        assert predictor["predict"](importer, QFX) == "Assets:Ally"
@@ -0,0 +1,47 @@
+from os import path
+
+from beancount_reds_importers.importers.unitedoverseas import uobbank
+from beancount_reds_importers.libreader import xlsreader
+
+XLS = path.join(
+    path.dirname(__file__),
+    "../../../importers/unitedoverseas/tests/ACC_TXN_History_1234_clean.xls",
+)
+
+
+def make_importer(max_rows=None):
+    importer = uobbank.Importer({"main_account": "Assets:UOB", "currency": "SGD"})
+    if max_rows:
+        importer.identify_max_rows = max_rows
+    return importer
+
+
+def clear_caches():
+    xlsreader._sniff_cache.clear()
+    xlsreader._raw_rows_cache.clear()
+
+
+def test_identify_max_rows():
+    clear_caches()
+    # "Account Type" is in the 6th row
+    assert not make_importer(5).identify(XLS)
+    assert make_importer(6).identify(XLS)
+    assert make_importer().identify(XLS)
+
+
+def test_file_read_once(monkeypatch):
+    reads = []
+    read_raw = uobbank.Importer.read_raw
+
+    def counting_read_raw(self, file):
+        reads.append(file)
+        return read_raw(self, file)
+
+    monkeypatch.setattr(uobbank.Importer, "read_raw", counting_read_raw)
+    clear_caches()
+    importer = make_importer()
+    assert importer.identify(XLS)
+    assert importer.extract(XLS)
+    # Other instances reuse what was read, too
+    assert make_importer().identify(XLS)
+    assert len(reads) == 1
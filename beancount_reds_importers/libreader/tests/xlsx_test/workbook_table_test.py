@@ -0,0 +1,83 @@
+"""Test reading xlsx files in openpyxl's read-only mode."""
+
+import csv
+import datetime
+import zipfile
+from io import StringIO
+
+import openpyxl
+import petl as etl
+
+from beancount_reds_importers.importers import workday
+from beancount_reds_importers.libreader import xlsxreader
+
+ROWS = [
+    ["Section 1", None, None],
+    ["date", "amount", "memo"],
+    [datetime.datetime(2024, 1, 2), 1.5, "first, with a comma"],
+    [datetime.datetime(2024, 1, 3), 2, 'multi\nline "quoted"'],
+    [None, None, None],
+    ["Section 2", None, None],
+    ["name", "value", None],
+    ["x", True, None],
+]
+
+
+def write_workbook(tmp_path):
+    wb = openpyxl.Workbook()
+    for row in ROWS:
+        wb.active.append(row)
+    wb.active["B3"].number_format = "0.000"
+    file = str(tmp_path / "test.xlsx")
+    wb.save(file)
+    return file
+
+
+def csv_round_trip(file):
+    """What xlsx_multitable_reader.read_raw (used by workday) used to do"""
+    in_memory_file = StringIO()
+    csv_writer = csv.writer(in_memory_file)
+    for r in openpyxl.load_workbook(file).worksheets[0].rows:
+        csv_writer.writerow([cell.value for cell in r])
+    in_memory_file.seek(0)
+    return etl.fromcsv(etl.MemorySource(in_memory_file.read().encode()))
+
+
+def test_multitable_same_as_csv_round_trip(tmp_path):
+    file = write_workbook(tmp_path)
+    rdr = workday.Importer({}).read_raw(file)
+    assert list(rdr) == [tuple(r) for r in csv_round_trip(file)]
+
+
+def test_rows_read_once_and_on_demand(tmp_path):
+    file = write_workbook(tmp_path)
+    rdr = xlsxreader.WorkbookTable(file)
+    assert list(rdr.head(1)) == [tuple(ROWS[0]), tuple(ROWS[1])]
+    assert len(rdr.rows) == 2
+    assert list(rdr) == [tuple(r) for r in ROWS]
+    assert list(rdr) == [tuple(r) for r in ROWS]
+    assert rdr.formats[1] == {"0.000": 1, "General": 2}
+
+
+def test_wrong_dimensions(tmp_path):
+    file = write_workbook(tmp_path)
+    # Files written by other tools may store dimensions smaller than the sheet
+    tampered = str(tmp_path / "tampered.xlsx")
+    with zipfile.ZipFile(file) as src, zipfile.ZipFile(tampered, "w") as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            if item.filename == "xl/worksheets/sheet1.xml":
+                data = data.replace(b'<dimension ref="A1:C8"', b'<dimension ref="A1:B2"')
+            dst.writestr(item, data)
+    assert len(list(xlsxreader.WorkbookTable(tampered))) == len(ROWS)
+    assert list(xlsxreader.WorkbookTable(file)) == [tuple(r) for r in ROWS]
+
+
+def test_close(tmp_path):
+    file = write_workbook(tmp_path)
+    rdr = xlsxreader.WorkbookTable(file)
+    assert list(rdr.head(1)) == [tuple(ROWS[0]), tuple(ROWS[1])]
+    rdr.close()
+    assert rdr.unread is None
+    assert list(rdr) == [tuple(r) for r in ROWS]
+    assert rdr.formats[1] == {"0.000": 1, "General": 2}
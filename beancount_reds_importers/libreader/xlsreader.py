@@ -1,7 +1,11 @@
 """xlsx importer module for beancount to be used along with investment/banking/other importer modules in
 beancount_reds_importers."""
 
+import itertools
+import os
 import re
+import threading
+from collections import OrderedDict
 from decimal import ROUND_HALF_UP, Decimal
 from os import devnull
 
@@ -10,6 +14,33 @@ from beancount.core.number import D
 
 from beancount_reds_importers.libreader import csvreader
 
+# The text of the first rows of recently identified files, shared by importer instances, since
+# each one identifying the same file would otherwise join it again. See Importer.sniff_rows()
+SNIFF_CACHE_MAX_ENTRIES = 16
+_sniff_cache = OrderedDict()
+_sniff_cache_lock = threading.Lock()
+
+# The rows of recently read xls files, read once for identify() and read_file(). See
+# Importer.read_raw_rows()
+RAW_ROWS_CACHE_MAX_ENTRIES = 4
+_raw_rows_cache = OrderedDict()
+_raw_rows_cache_lock = threading.Lock()
+
+
+def file_mtime(file):
+    try:
+        return os.stat(file).st_mtime_ns
+    except OSError:
+        return None
+
+
+def quantize(convert, quantizer):
+    def quantized(x):
+        x = convert(x)
+        return D(x).quantize(quantizer, rounding=ROUND_HALF_UP) if x else x
+
+    return quantized
+
 
 class Importer(csvreader.Importer):
     FILE_EXTS = ["xls"]
@@ -20,12 +51,9 @@ class Importer(csvreader.Importer):
             self.file_read_done = False
             self.reader_ready = False
 
-            # TODO: this reads the entire file. Chop off after perhaps 2k or n lines
-            rdr = self.read_raw(file)
-            header = ""
-            for r in rdr:
-                line = "".join(str(x) for x in r)
-                header += line
+            # Set identify_max_rows to only match against the text of the first rows
+            rows = self.sniff_rows(file, getattr(self, "identify_max_rows", None))
+            header = "".join(rows)
 
             # TODO
             # account_number = self.config.get('account_number', '')
@@ -35,6 +63,48 @@ class Importer(csvreader.Importer):
             if re.match(self.header_identifier, header):
                 self.reader_ready = True
 
+    def sniff_rows(self, file, max_rows):
+        """Return the text of each of the first max_rows rows of the file (all rows if None)."""
+        key = (type(self).read_raw, file, file_mtime(file), max_rows)
+        with _sniff_cache_lock:
+            if key in _sniff_cache:
+                _sniff_cache.move_to_end(key)
+                return _sniff_cache[key]
+
+        rdr = self.sniff_table(file)
+        rows = ["".join(str(x) for x in r) for r in itertools.islice(rdr, max_rows)]
+        if hasattr(rdr, "close"):
+            rdr.close()  # see xlsxreader.WorkbookTable.close()
+
+        with _sniff_cache_lock:
+            _sniff_cache[key] = rows
+            while len(_sniff_cache) > SNIFF_CACHE_MAX_ENTRIES:
+                _sniff_cache.popitem(last=False)
+        return rows
+
+    def sniff_table(self, file):
+        """The table identify() looks at the first rows of"""
+        return self.read_raw_rows(file)
+
+    def read_raw_rows(self, file):
+        """xlrd loads the whole workbook, even to identify the file, so the rows it read are kept
+        (for the last few files, and shared by importer instances) for read_file() to reuse."""
+        if not getattr(self, "materialize_table", True):
+            return self.read_raw(file)
+        key = (type(self).read_raw, file, file_mtime(file))
+        with _raw_rows_cache_lock:
+            if key in _raw_rows_cache:
+                _raw_rows_cache.move_to_end(key)
+                return _raw_rows_cache[key]
+
+        rdr = etl.wrap(list(self.read_raw(file)))
+
+        with _raw_rows_cache_lock:
+            _raw_rows_cache[key] = rdr
+            while len(_raw_rows_cache) > RAW_ROWS_CACHE_MAX_ENTRIES:
+                _raw_rows_cache.popitem(last=False)
+        return rdr
+
     def read_raw(self, file):
         # set logfile to ignore WARNING *** file size (92598) not 512 + multiple of sector size (512)
         return etl.fromxls(file, logfile=open(devnull, "w"))
@@ -60,10 +130,10 @@ class Importer(csvreader.Importer):
         """
         return getattr(self, "currency_precision", 2)
 
-    def convert_columns(self, rdr):
+    def get_column_converters(self, rdr):
         """Override to apply quantization for Excel files"""
-        # First, call parent's convert_columns to do standard conversions
-        rdr = super().convert_columns(rdr)
+        # First, get parent's converters for the standard conversions
+        converters = super().get_column_converters(rdr)
 
         # Apply quantization to currency fields
         for field in self.get_currency_fields():
@@ -72,8 +142,6 @@ class Importer(csvreader.Importer):
 
             precision = self.get_precision_for_field(rdr, field)
             quantizer = Decimal("0." + "0" * precision) if precision > 0 else Decimal("1")
-            rdr = rdr.convert(
-                field, lambda x: D(x).quantize(quantizer, rounding=ROUND_HALF_UP) if x else x
-            )
+            converters[field] = quantize(converters.get(field, D), quantizer)
 
-        return rdr
+        return converters
@@ -1,14 +1,7 @@
 """xlsx importer module for beancount to be used along with investment/banking/other importer modules in
 beancount_reds_importers."""
 
-import csv
-import warnings
-from io import StringIO
-
-import openpyxl
-import petl as etl
-
-from beancount_reds_importers.libreader import csv_multitable_reader
+from beancount_reds_importers.libreader import csv_multitable_reader, xlsxreader
 
 # This xlsx reader uses petl to read a .csv with multiple tables into a dictionary of petl tables. The section
 # title is the key. See csv_multitable_reader for more.
@@ -24,23 +17,11 @@ class Importer(csv_multitable_reader.Importer):
             self.reader_ready = True
 
     def read_raw(self, file):
-        # return etl.fromcsv(file)
-
-        in_memory_file = StringIO()
-        csv_writer = csv.writer(in_memory_file)
-
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            wb = openpyxl.load_workbook(file)
-            sh = wb.worksheets[0]
-
-        for r in sh.rows:
-            csv_writer.writerow([cell.value for cell in r])
-        in_memory_file.seek(0)
-        rawlines = in_memory_file.read().encode()
-        raw = etl.MemorySource(rawlines)
-        rdr = etl.fromcsv(raw)
-        return rdr
+        # Cells are converted to the strings a csv file would contain, as downstream code expects
+        def to_csv_row(values):
+            return tuple("" if v is None else str(v) for v in values)
+
+        return xlsxreader.WorkbookTable(file, data_only=False, worksheet=0, convert=to_csv_row)
 
     def is_section_title(self, row):
         if len(row) == 1:
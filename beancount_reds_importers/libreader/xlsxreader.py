@@ -2,6 +2,9 @@
 beancount_reds_importers."""
 
 import re
+import threading
+import warnings
+from collections import Counter, defaultdict
 
 import openpyxl
 import petl as etl
@@ -9,39 +12,93 @@ import petl as etl
 from beancount_reds_importers.libreader import xlsreader
 
 
-class Importer(xlsreader.Importer):
-    FILE_EXTS = ["xlsx"]
+class WorkbookTable(etl.Table):
+    """A petl table of the rows of a worksheet, read with openpyxl in streaming read-only mode.
 
-    def read_raw(self, file):
-        """Read xlsx file, preserving number formatting information for currency fields"""
-        wb = openpyxl.load_workbook(file, data_only=True)
-        ws = wb.active
+    Rows are read as they are first iterated over, and kept, so the workbook is read at most once,
+    and only as far as needed (eg: to identify the file). As rows are read, the number formats of
+    numeric cells are counted by column in self.formats: {column index: Counter of formats}."""
 
-        # Extract data with formatting metadata
-        data = []
-        formatting_info = {}  # Store formatting by (row, col)
+    def __init__(self, file, data_only=True, worksheet=None, convert=tuple):
+        self.file = file
+        self.data_only = data_only
+        self.worksheet = worksheet  # index of the worksheet to read. None reads the active one
+        self.convert = convert  # applied to each row's values
+        self.rows = []
+        self.formats = defaultdict(Counter)
+        self.unread = None
+        self.lock = threading.Lock()  # the table may be shared. See reader.sharing_reads()
 
-        for row_idx, row in enumerate(ws.iter_rows()):
-            row_data = []
-            for col_idx, cell in enumerate(row):
-                value = cell.value
-                number_format = cell.number_format
+    def read_rows(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            wb = openpyxl.load_workbook(self.file, read_only=True, data_only=self.data_only)
+        try:
+            ws = wb.active if self.worksheet is None else wb.worksheets[self.worksheet]
+            # iter_rows() stops at the dimensions stored in the file, which can be wrong for files
+            # written by other tools, dropping cells. Read all cells instead, but pad rows to the
+            # stored width, as iter_rows() would
+            width = ws.max_column or 0
+            ws.reset_dimensions()
+            for row in ws.iter_rows():
+                values = []
+                for col_idx, cell in enumerate(row):
+                    value = cell.value
+                    if isinstance(value, (int, float)) and getattr(cell, "number_format", None):
+                        self.formats[col_idx][cell.number_format] += 1
+                    values.append(value)
+                values.extend([None] * (width - len(values)))
+                yield self.convert(values)
+        finally:
+            wb.close()
+
+    def __iter__(self):
+        with self.lock:
+            if self.unread is None:
+                self.unread = self.read_rows()
+        idx = 0
+        while True:
+            if idx == len(self.rows):
+                with self.lock:
+                    if idx == len(self.rows):
+                        row = next(self.unread, None)
+                        if row is None:
+                            return
+                        self.rows.append(row)
+            yield self.rows[idx]
+            idx += 1
+
+    def close(self):
+        """Close the workbook if it wasn't read to the end (eg: after identifying the file), rather
+        than leaving that to garbage collection. Rows not yet read are read afresh, from a reopened
+        workbook, if iterated over later. Don't call this while the table is being iterated over."""
+        with self.lock:
+            if self.unread is not None:
+                self.unread.close()
+                self.unread = None
+                self.rows = []
+                self.formats.clear()
 
-                # Store formatting info for numeric cells
-                if isinstance(value, (int, float)) and number_format:
-                    formatting_info[(row_idx, col_idx)] = number_format
 
-                row_data.append(value)
-            data.append(row_data)
+class Importer(xlsreader.Importer):
+    FILE_EXTS = ["xlsx"]
 
-        # Store formatting info for use in convert_columns
-        rdr = etl.wrap(data)
+    def read_raw(self, file):
+        """Read xlsx file, preserving number formatting information for currency fields"""
+        rdr = WorkbookTable(file)
+        # Store formatting metadata so get_precision_for_field can access it. The transformed tables
+        # convert_columns gets don't carry attributes of the raw table along
+        self.xlsx_formatting = rdr.formats
+        return rdr
 
-        # Store formatting metadata so convert_columns can access it
-        # This is a bit of a hack, but petl doesn't have a clean way to pass metadata
-        rdr._xlsx_formatting = formatting_info
-        rdr._xlsx_header_row = 0  # Will be updated after we find the actual header
+    def sniff_table(self, file):
+        # Unlike xlrd, openpyxl only reads as many rows as identify() needs. See sniff_rows()
+        return self.read_raw(file)
 
+    def read_raw_rows(self, file):
+        # WorkbookTable keeps the rows it reads, so is shared as is, along with its number formats
+        rdr = self.shared_read((type(self).read_raw, file), lambda: self.read_raw(file))
+        self.xlsx_formatting = rdr.formats
         return rdr
 
     def get_precision_for_field(self, rdr, field_name):
@@ -57,20 +114,18 @@ class Importer(xlsreader.Importer):
             return super().get_precision_for_field(rdr, field_name)
 
         # Get formatting info if available
-        formatting_info = getattr(rdr, "_xlsx_formatting", {})
+        formatting_info = getattr(self, "xlsx_formatting", {})
 
         # Analyze formats in this column to determine precision
-        precisions = []
-        for row_idx in range(len(rdr)):
-            fmt = formatting_info.get((row_idx, col_idx))
-            if fmt:
-                precision = self.get_precision_from_format(fmt)
-                if precision is not None:
-                    precisions.append(precision)
+        precisions = Counter()
+        for fmt, count in formatting_info.get(col_idx, {}).items():
+            precision = self.get_precision_from_format(fmt)
+            if precision is not None:
+                precisions[precision] += count
 
         # Use most common precision, or fall back to parent's default
         if precisions:
-            return max(set(precisions), key=precisions.count)
+            return precisions.most_common(1)[0][0]
         else:
             return super().get_precision_for_field(rdr, field_name)
 
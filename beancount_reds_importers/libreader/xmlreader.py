@@ -5,6 +5,8 @@ the logic will have to be the institution specific readers.
 
 """
 
+import threading
+
 from beangulp import Importer as BGImporter
 from lxml import etree
 
@@ -14,11 +16,14 @@ from beancount_reds_importers.libreader import reader
 class Importer(reader.Reader, BGImporter):
     FILE_EXTS = ["xml"]
 
+    # XPath expressions compiled by each class, shared by its instances. See compile_xpath()
+    _xpath_lock = threading.Lock()
+
     def initialize_reader(self, file):
         if getattr(self, "file", None) != file:
             self.file = file
             self.reader_ready = False
-            self.xmltree = etree.parse(file)
+            self.parse_file(file)
             self.reader_ready = self.deep_identify(file)
         if self.reader_ready:
             self.set_currency()
@@ -36,13 +41,62 @@ class Importer(reader.Reader, BGImporter):
         return None
 
     def read_file(self, file):
-        self.xmltree = etree.parse(file)
+        # The file was already parsed by initialize_reader()
+        if getattr(self, "xmltree_file", None) != file:
+            self.parse_file(file)
+
+    def parse_file(self, file):
+        self.xmltree = self.read_tree(file)
+        self.xmltree_file = file
+        self.xpath_results = {}
+
+    def read_tree(self, file):
+        """Parse file. If self.xml_stream_tag is set, the file is instead parsed incrementally, and
+        each element with that tag for which keep_streamed_element() returns False is discarded as
+        soon as it has been read, so that only the parts of a large file an importer needs are held
+        in memory."""
+        stream_tag = getattr(self, "xml_stream_tag", None)
+        if not stream_tag:
+            return etree.parse(file)
+        context = etree.iterparse(file, events=("end",), tag=stream_tag)
+        for _, elem in context:
+            if not self.keep_streamed_element(elem):
+                elem.getparent().remove(elem)
+        return etree.ElementTree(context.root)
+
+    def keep_streamed_element(self, elem):
+        """For overriding. See read_tree()"""
+        return True
+
+    @classmethod
+    def compile_xpath(cls, xpath_expr):
+        """Return the compiled etree.XPath for xpath_expr, which is compiled once per class."""
+        xpaths = cls.__dict__.get("_xpaths")
+        if xpaths is None:
+            with cls._xpath_lock:
+                xpaths = cls.__dict__.get("_xpaths")
+                if xpaths is None:
+                    xpaths = {}
+                    cls._xpaths = xpaths
+        try:
+            return xpaths[xpath_expr]
+        except KeyError:
+            return xpaths.setdefault(xpath_expr, etree.XPath(xpath_expr))
+
+    def xpath(self, xpath_expr):
+        """Return the list of elements in the file at the given XPath expression. Results are
+        memoized for the file, since importers tend to look up the same paths repeatedly."""
+        try:
+            return self.xpath_results[xpath_expr]
+        except KeyError:
+            elements = self.compile_xpath(xpath_expr)(self.xmltree)
+            self.xpath_results[xpath_expr] = elements
+            return elements
 
     def get_xpath_elements(self, xpath_expr, xml_interpreter=lambda x: x):
         """Extract a list of elements in the XML file at the given XPath expression. Typically,
         transactions are stored in an xml path, and this extracts them."""
-        elements = self.xmltree.xpath(xpath_expr)
-        for elem in elements:
+        for elem in self.xpath(xpath_expr):
             yield xml_interpreter(elem.attrib)
 
     def get_transactions(self):
@@ -0,0 +1,181 @@
+"""Fund info lookups for the investments transaction builder."""
+
+import json
+import threading
+from collections import ChainMap, defaultdict
+
+from beancount import loader
+from beancount.core import data
+
+# id(fund_data) -> (fund_data, FundDatabase). See FundDatabase.get()
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+class FundIndex:
+    """Finds fund info by security id: an exact match if there is one, else the first id (in
+    insertion order) containing the security id. For example, an isin like "US293409829" is found
+    from a cusip like "29340982".
+
+    Rather than scanning every id, substring matches are looked up in an index of the ngrams of all
+    ids, and only ids containing the rarest ngram of the security id are checked. Results are
+    memoized, since files refer to the same few securities over and over.
+
+    An index can be layered over a parent index, in which case funds_db holds only the ids missing
+    from the parent, and the parent's ids come first."""
+
+    NGRAM = 3
+
+    def __init__(self, funds_db, parent=None):
+        self.funds_db = funds_db  # {id: (ticker, long name)}
+        self.parent = parent
+        self.ids = list(funds_db)
+        self.ngrams = defaultdict(list)  # ngram -> indexes into self.ids, in ascending order
+        for idx, i in enumerate(self.ids):
+            if isinstance(i, str):
+                for ngram in {i[n : n + self.NGRAM] for n in range(len(i) - self.NGRAM + 1)}:
+                    self.ngrams[ngram].append(idx)
+        self.resolved = {}
+
+    def lookup(self, security_id):
+        """Return (ticker, long name) for security_id, or None if not found."""
+        try:
+            return self.resolved[security_id]
+        except KeyError:
+            pass
+        result = self.lookup_exact(security_id)
+        if result is None:
+            result = self.lookup_substring(security_id)
+        self.resolved[security_id] = result
+        return result
+
+    def lookup_exact(self, security_id):
+        result = self.parent.lookup_exact(security_id) if self.parent else None
+        return self.funds_db.get(security_id) if result is None else result
+
+    def lookup_substring(self, security_id):
+        if self.parent:
+            result = self.parent.lookup_substring(security_id)
+            if result is not None:
+                return result
+
+        if len(security_id) < self.NGRAM:
+            candidates = range(len(self.ids))
+        else:
+            postings = [
+                self.ngrams.get(security_id[n : n + self.NGRAM], [])
+                for n in range(len(security_id) - self.NGRAM + 1)
+            ]
+            candidates = min(postings, key=len)
+        for idx in candidates:
+            if security_id in self.ids[idx]:
+                return self.funds_db[self.ids[idx]]
+        return None
+
+
+class FundDatabase:
+    """fund_info's fund_data, [(ticker, id, long name), ...], as the dicts and indexes the
+    investments transaction builder looks funds up in.
+
+    A config typically shares one fund_data list across many importers. FundDatabase.get() builds
+    the database for it once, and returns the same one to every importer. Per-file additions (eg:
+    from an ofx SECLIST) go into a small database layered over the shared one (see
+    with_securities()), which is never modified.
+
+    fund_info's fund_data can also be a FundDatabase, for example one loaded from a file prebuilt
+    from a ledger's commodity declarations:
+
+        FundDatabase.from_ledger("main.beancount").save("funds.json")
+
+    and then, in the import config:
+
+        fund_info = {"fund_data": FundDatabase.load("funds.json"), "money_market": [...]}
+    """
+
+    NAMES = ("funds_by_id", "funds_by_ticker")
+
+    def __init__(self, fund_data, parent=None):
+        self.fund_data = list(fund_data)
+        self.parent = parent
+        self.own = {
+            "funds_by_id": {i: (ticker, desc) for ticker, i, desc in self.fund_data},
+            "funds_by_ticker": {ticker: (ticker, desc) for ticker, _, desc in self.fund_data},
+        }
+        if parent is None:
+            self.funds_by_id = self.own["funds_by_id"]
+            self.funds_by_ticker = self.own["funds_by_ticker"]
+        else:
+            # ChainMap iterates the parent's keys first, the same order a merged dict would have
+            self.funds_by_id = ChainMap(self.own["funds_by_id"], parent.funds_by_id)
+            self.funds_by_ticker = ChainMap(self.own["funds_by_ticker"], parent.funds_by_ticker)
+        self.indexes = {}
+
+    @classmethod
+    def get(cls, fund_data):
+        """Return the (shared) database for fund_data"""
+        if isinstance(fund_data, cls):
+            return fund_data
+        with _databases_lock:
+            cached = _databases.get(id(fund_data))
+            # The length check catches entries appended to the list after it was first seen
+            if cached and cached[0] is fund_data and len(cached[1].fund_data) == len(fund_data):
+                return cached[1]
+            db = cls(fund_data)
+            _databases[id(fund_data)] = (fund_data, db)
+            return db
+
+    def index(self, name):
+        """Return the FundIndex for the funds_by_id or funds_by_ticker dict"""
+        if name not in self.indexes:
+            parent = self.parent.index(name) if self.parent else None
+            self.indexes[name] = FundIndex(self.own[name], parent)
+        return self.indexes[name]
+
+    def with_securities(self, securities):
+        """Return a database with the given (ticker, id, long name) entries added, for ids and
+        tickers not already in this one. This database is shared by, and not modified in, the
+        returned one."""
+        fund_data = [
+            (ticker, i, desc)
+            for ticker, i, desc in securities
+            if i not in self.funds_by_id or ticker not in self.funds_by_ticker
+        ]
+        if not fund_data:
+            return self
+        db = FundDatabase([], parent=self)
+        for ticker, i, desc in fund_data:
+            # As with fund_data, existing entries take precedence
+            if i not in self.funds_by_id:
+                db.own["funds_by_id"].setdefault(i, (ticker, desc))
+            if ticker not in self.funds_by_ticker:
+                db.own["funds_by_ticker"].setdefault(ticker, (ticker, desc))
+        db.fund_data = fund_data
+        return db
+
+    @classmethod
+    def from_ledger(cls, filename, id_keys=("cusip", "isin")):
+        """Build a database from the commodity declarations in a ledger, which look like:
+
+        2010-01-01 commodity VTI
+          name: "Vanguard Total Stock Market ETF"
+          cusip: "922908769"
+          isin: "US9229087690"
+        """
+        entries, _, _ = loader.load_file(filename)
+        fund_data = []
+        for entry in entries:
+            if isinstance(entry, data.Commodity):
+                for key in id_keys:
+                    if key in entry.meta:
+                        name = entry.meta.get("name", entry.currency)
+                        fund_data.append((entry.currency, str(entry.meta[key]), name))
+        return cls(fund_data)
+
+    def save(self, filename):
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(self.fund_data, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, encoding="utf-8") as f:
+            return cls(tuple(row) for row in json.load(f))
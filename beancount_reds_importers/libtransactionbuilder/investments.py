@@ -8,7 +8,11 @@ from beancount.core import amount, data, flags
 from beancount.core.position import CostSpec
 from beangulp import Importer as BGImporter
 
-from beancount_reds_importers.libtransactionbuilder import common, transactionbuilder
+from beancount_reds_importers.libtransactionbuilder import (
+    common,
+    funds,
+    transactionbuilder,
+)
 
 
 class Importer(BGImporter, transactionbuilder.TransactionBuilder):
@@ -97,23 +101,32 @@ class Importer(BGImporter, transactionbuilder.TransactionBuilder):
             self.fund_data = self.config["fund_info"][
                 "fund_data"
             ]  # [(ticker, id, long_name), ...]
-            self.funds_by_id = {i: (ticker, desc) for ticker, i, desc in self.fund_data}
-            self.funds_by_ticker = {ticker: (ticker, desc) for ticker, _, desc in self.fund_data}
 
             # Augment fund_info from OFX SECLIST if available; config-provided entries take precedence
+            securities = []
             try:
                 for sec in self.ofx.security_list or []:
                     uid = getattr(sec, "uniqueid", None)
                     ticker = getattr(sec, "ticker", None)
                     name = getattr(sec, "name", "")
                     if uid and ticker:
-                        self.funds_by_id.setdefault(uid, (ticker, name))
-                        self.funds_by_ticker.setdefault(ticker, (ticker, name))
+                        securities.append((ticker, uid, name))
             except AttributeError:
                 pass
 
+            # The database built from fund_data is shared across importers. Securities are added to
+            # a per-file copy
+            self.fund_database = funds.FundDatabase.get(self.fund_data).with_securities(securities)
+            self.funds_by_id = self.fund_database.funds_by_id
+            self.funds_by_ticker = self.fund_database.funds_by_ticker
+
             # Most ofx/csv files refer to funds by id (cusip/isin etc.) Some use tickers instead
-            self.funds_db = getattr(self, getattr(self, "funds_db_txt", "funds_by_id"))
+            funds_db_txt = getattr(self, "funds_db_txt", "funds_by_id")
+            self.funds_db = getattr(self, funds_db_txt)
+            if funds_db_txt in funds.FundDatabase.NAMES:
+                self.funds_index = self.fund_database.index(funds_db_txt)
+            else:
+                self.funds_index = funds.FundIndex(self.funds_db)
             self.build_account_map()
 
         self.initialized = True
@@ -170,18 +183,9 @@ class Importer(BGImporter, transactionbuilder.TransactionBuilder):
             # under NOTICKER in case that is useful to the user. If it isn't, this still helps to
             # make the user aware of the missing tickers
             return "NOTICKER", "No ticker was specified in the input file"
-        try:
-            # isin might look like "US293409829" while the ofx use only a substring like "29340982"
-            ticker = None
-            try:  # first try a full match, fall back to substring
-                ticker, ticker_long_name = [
-                    v for k, v in self.funds_db.items() if security_id == k
-                ][0]
-            except IndexError:
-                ticker, ticker_long_name = [
-                    v for k, v in self.funds_db.items() if security_id in k
-                ][0]
-        except IndexError:
+        # isin might look like "US293409829" while the ofx use only a substring like "29340982"
+        fund_info = self.funds_index.lookup(security_id)
+        if fund_info is None:
             print(f"Error: fund info not found for {security_id}", file=sys.stderr)
             securities = self.get_security_list()
             if "" in securities:
@@ -209,7 +213,7 @@ class Importer(BGImporter, transactionbuilder.TransactionBuilder):
             # print(f"List of securities without fund info: {securities_missing}", file=sys.stderr)
             # import pdb; pdb.set_trace()
             sys.exit(1)
-        return ticker, ticker_long_name
+        return fund_info
 
     def get_target_acct_custom(self, transaction, ticker=None):
         """This method is for importers to override. The overridden method can return a target account for
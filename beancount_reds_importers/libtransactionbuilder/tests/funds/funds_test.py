@@ -0,0 +1,91 @@
+import random
+
+from beancount_reds_importers.libtransactionbuilder import funds
+
+FUNDS_DB = {
+    "US9229087690": ("VTI", "Vanguard Total Stock Market ETF"),
+    "922908769": ("VTI_CUSIP", "Vanguard Total Stock Market ETF (cusip)"),
+    "US9219378356": ("BND", "Vanguard Total Bond Market ETF"),
+    "VFIAX": ("VFIAX", "Vanguard 500 Index Admiral"),
+}
+
+
+def linear_lookup(funds_db, security_id):
+    """The lookup FundIndex replaces"""
+    exact = (v for k, v in funds_db.items() if security_id == k)
+    substring = (v for k, v in funds_db.items() if security_id in k)
+    return next(exact, next(substring, None))
+
+
+def test_exact_match_preferred():
+    assert funds.FundIndex(FUNDS_DB).lookup("922908769") == FUNDS_DB["922908769"]
+
+
+def test_substring_match_in_insertion_order():
+    index = funds.FundIndex(FUNDS_DB)
+    assert index.lookup("2290876") == FUNDS_DB["US9229087690"]
+    assert index.lookup("921937835") == FUNDS_DB["US9219378356"]
+    assert index.lookup("FI") == FUNDS_DB["VFIAX"]
+    assert index.lookup("000000") is None
+
+
+def test_same_as_linear_lookup():
+    rng = random.Random(0)
+    funds_db = {
+        "".join(rng.choice("0123456789AB") for _ in range(rng.randint(5, 12))): (str(n), "")
+        for n in range(500)
+    }
+    index = funds.FundIndex(funds_db)
+    ids = list(funds_db)
+    for _ in range(2000):
+        i = rng.choice(ids)
+        start = rng.randint(0, len(i) - 1)
+        security_id = i[start : rng.randint(start + 1, len(i))]
+        if rng.random() < 0.2:
+            security_id += "Z"
+        assert index.lookup(security_id) == linear_lookup(funds_db, security_id)
+
+
+FUND_DATA = [(ticker, i, desc) for i, (ticker, desc) in FUNDS_DB.items()]
+
+
+def test_database_shared():
+    db = funds.FundDatabase.get(FUND_DATA)
+    assert funds.FundDatabase.get(FUND_DATA) is db
+    assert funds.FundDatabase.get(list(FUND_DATA)) is not db
+    assert funds.FundDatabase.get(db) is db
+
+
+def test_with_securities_copy_on_write():
+    db = funds.FundDatabase(FUND_DATA)
+    assert db.with_securities([("VTI", "US9229087690", "Other name")]) is db
+
+    file_db = db.with_securities([("VTI", "NEWID", "Other"), ("NEW", "NEWID2", "New fund")])
+    assert "NEWID" not in db.funds_by_id and "NEW" not in db.funds_by_ticker
+    assert file_db.funds_by_id["NEWID"] == ("VTI", "Other")
+    assert file_db.funds_by_ticker["VTI"] == FUNDS_DB["US9229087690"]
+    assert file_db.funds_by_ticker["NEW"] == ("NEW", "New fund")
+    assert list(file_db.funds_by_id) == [*FUNDS_DB, "NEWID", "NEWID2"]
+
+    index = file_db.index("funds_by_id")
+    assert index.parent is db.index("funds_by_id")
+    assert index.lookup("EWID") == ("VTI", "Other")
+    assert index.lookup("2290876") == FUNDS_DB["US9229087690"]
+
+
+def test_from_ledger_save_load(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    ledger.write_text(
+        "2010-01-01 commodity VTI\n"
+        '  name: "Vanguard Total Stock Market ETF"\n'
+        '  cusip: "922908769"\n'
+        '  isin: "US9229087690"\n'
+        "2010-01-01 commodity USD\n"
+    )
+    db = funds.FundDatabase.from_ledger(str(ledger))
+    db.save(tmp_path / "funds.json")
+    loaded = funds.FundDatabase.load(tmp_path / "funds.json")
+    assert loaded.fund_data == [
+        ("VTI", "922908769", "Vanguard Total Stock Market ETF"),
+        ("VTI", "US9229087690", "Vanguard Total Stock Market ETF"),
+    ]
@@ -4,7 +4,12 @@ Multi-threaded."""
 
 import asyncio
 import configparser
+import contextlib
+import json
 import os
+import signal
+import tempfile
+import time
 
 import click
 import tabulate
@@ -35,6 +40,188 @@ def get_sites(sites, t, config):
     return [s for s in sites if config[s]["type"] == t]
 
 
+def parse_duration(duration):
+    """Parse a duration like "90", "90s", "5m", "12h" or "1d" into seconds"""
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+    duration = duration.strip()
+    if duration[-1:] in units:
+        return float(duration[:-1]) * units[duration[-1]]
+    return float(duration)
+
+
+class Scheduler:
+    """Decides when each site can be downloaded, from the concurrency limits, rate limits and
+    dependencies in the config. See download() for these settings."""
+
+    def __init__(self, config, sites, max_concurrency=None):
+        self.config = config
+        self.sites = sites
+        defaults = config.defaults()
+        if max_concurrency is None and "max_concurrency" in defaults:
+            max_concurrency = int(defaults["max_concurrency"])
+        self.limits = {None: max_concurrency}
+        for key, value in defaults.items():
+            if key.startswith("max_concurrency_"):
+                self.limits[key[len("max_concurrency_") :]] = int(value)
+        self.semaphores = {}
+        self.next_start = {}  # rate limit group -> earliest time the next site in it can start
+        self.rate_limit_locks = {}
+        self.finished = {}  # site -> future, set to whether it succeeded
+        self.cycles = self.find_cycles()
+
+    def dependencies(self, site):
+        try:
+            depends_on = self.config[site].get("depends_on", "")
+        except KeyError:
+            return []
+        deps = [d.strip() for d in depends_on.split(",") if d.strip()]
+        return [d for d in deps if d in self.sites]
+
+    def find_cycles(self):
+        """Return the set of sites that (indirectly) depend on themselves"""
+        cycles = set()
+        for site in self.sites:
+            seen, pending = set(), self.dependencies(site)
+            while pending:
+                dep = pending.pop()
+                if dep == site:
+                    cycles.add(site)
+                    break
+                if dep not in seen:
+                    seen.add(dep)
+                    pending.extend(self.dependencies(dep))
+        return cycles
+
+    def future(self, site):
+        if site not in self.finished:
+            self.finished[site] = asyncio.get_running_loop().create_future()
+        return self.finished[site]
+
+    def done(self, site, succeeded):
+        if not self.future(site).done():
+            self.future(site).set_result(succeeded)
+
+    async def wait_for_dependencies(self, site):
+        """Wait for the sites site depends on to finish, and return whether they all succeeded"""
+        if site in self.cycles:
+            return False
+        results = [await self.future(dep) for dep in self.dependencies(site)]
+        return all(results)
+
+    def semaphore(self, key):
+        if key not in self.semaphores:
+            limit = self.limits.get(key)
+            self.semaphores[key] = asyncio.Semaphore(limit) if limit else None
+        return self.semaphores[key]
+
+    @contextlib.asynccontextmanager
+    async def slot(self, site):
+        """Wait until site can be started without exceeding the concurrency and rate limits"""
+        options = self.config[site]
+        semaphores = [s for s in (self.semaphore(None), self.semaphore(options["type"])) if s]
+        async with contextlib.AsyncExitStack() as stack:
+            for semaphore in semaphores:
+                await stack.enter_async_context(semaphore)
+            if "rate_limit" in options:
+                await self.wait_for_rate_limit(
+                    options.get("rate_limit_group", site), parse_duration(options["rate_limit"])
+                )
+            yield
+
+    async def wait_for_rate_limit(self, group, interval):
+        loop = asyncio.get_running_loop()
+        if group not in self.rate_limit_locks:
+            self.rate_limit_locks[group] = asyncio.Lock()
+        async with self.rate_limit_locks[group]:
+            delay = self.next_start.get(group, 0) - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.next_start[group] = loop.time() + interval
+
+
+def read_state(state_file):
+    """Return the state of past downloads: {site: {"last_success": time, "exit_code": ...,
+    "duration": seconds, "output_size": bytes}}"""
+    try:
+        with open(state_file, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_state(state_file, state):
+    os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+    # Write to a temporary file first, so a concurrent run never sees a partial file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(state_file)), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, state_file)
+
+
+def output_file(options):
+    if "output" in options:
+        return os.path.expanduser(os.path.expandvars(options["output"]))
+    return None
+
+
+def is_fresh(options, site_state, now):
+    """Whether the site was successfully downloaded less than min_interval ago, as recorded in the
+    state file. If an output file is configured, it must also have been written since: a failed
+    command may have already written (or truncated) it, which is why its mtime alone isn't enough"""
+    if "min_interval" not in options:
+        return False
+    last_success = site_state.get("last_success")
+    if site_state.get("exit_code") != 0 or last_success is None:
+        return False
+    output = output_file(options)
+    if output:
+        try:
+            last_success = min(last_success, os.stat(output).st_mtime)
+        except OSError:
+            return False
+    return now - last_success < parse_duration(options["min_interval"])
+
+
+def sites_needing_updates(config, sites, ledger):
+    """Return the sites with any of their accounts (the `accounts` setting, a comma separated list)
+    needing updates in the ledger, according to needs-update. Sites without the setting are
+    always returned."""
+    needed = needs_update.get_accounts_needing_updates(
+        ledger, os.environ.get("NEEDS_UPDATE_INDEX")
+    )
+
+    def is_needed(account):
+        return any(a == account or a.startswith(account + ":") for a in needed)
+
+    result = []
+    for site in sites:
+        accounts = config[site].get("accounts") if config.has_section(site) else None
+        if not accounts or any(is_needed(a.strip()) for a in accounts.split(",") if a.strip()):
+            result.append(site)
+    return result
+
+
+async def run_cmd(cmd, timeout=None):
+    """Run cmd in a shell, and return its exit status, or None if it timed out"""
+    # https://docs.python.org/3.8/library/asyncio-subprocess.html#asyncio.create_subprocess_exec
+    proc = await asyncio.create_subprocess_shell(
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        start_new_session=True,  # so the shell and what it runs can be killed together
+    )
+    try:
+        await asyncio.wait_for(proc.communicate(), timeout)
+    except TimeoutError:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        return None
+    return proc.returncode
+
+
 @cli.command(aliases=["list"])
 @click.option(
     "-c",
@@ -104,10 +291,64 @@ def complete_site_types(ctx, param, incomplete):
     default="",
     shell_complete=complete_site_types,
 )
+@click.option(
+    "-j",
+    "--jobs",
+    type=int,
+    default=None,
+    help="Maximum number of sites to download at once. Default: max_concurrency in the config, or "
+    "no limit",
+)
+@click.option(
+    "--force",
+    is_flag=True,
+    help="Download sites even if they were downloaded less than min_interval ago",
+    default=False,
+)
+@click.option(
+    "--state-file",
+    envvar="BEAN_DOWNLOAD_STATE",
+    help="File recording the last successful download of each site, its exit status, duration, "
+    "and output size. Default: state_file in the config, else state.json in the app directory",
+    type=click.Path(dir_okay=False),
+)
+@click.option(
+    "--ledger",
+    help="Only download sites with accounts (see `accounts` below) needing updates in this "
+    "beancount ledger, as shown by needs-update",
+    type=click.Path(exists=True, dir_okay=False),
+)
 @click.option("--dry-run", is_flag=True, help="Do not actually download", default=False)
 @click.option("--verbose", is_flag=True, help="Verbose", default=False)
-def download(config_file, sites, site_types, dry_run, verbose):  # noqa: C901
-    """Download statements for the specified institutions (sites)."""
+def download(  # noqa: C901
+    config_file, sites, site_types, jobs, force, state_file, ledger, dry_run, verbose
+):
+    """Download statements for the specified institutions (sites).
+
+    Sites are downloaded concurrently, subject to these optional settings in the config:
+
+    \b
+    [DEFAULT]
+    max_concurrency = 8             # sites downloaded at once (--jobs overrides this)
+    max_concurrency_investment = 2  # sites of type "investment" downloaded at once
+
+    \b
+    [site]
+    depends_on = site1, site2       # start after these sites, if they are being downloaded
+    rate_limit = 30s                # at least this long between starting sites in the same
+    rate_limit_group = fidelity     # group (default: just this site, eg: across retries)
+    timeout = 5m                    # of each attempt
+    retries = 2                     # on a nonzero exit status or a timeout
+    retry_backoff = 10s             # wait before the first retry, doubled for each next one
+
+    Sites downloaded recently can be skipped:
+
+    \b
+    [site]
+    min_interval = 12h              # skip the site if downloaded less than this long ago
+    output = ~/Downloads/bank.ofx   # judge by this file's mtime (default: the state file)
+    accounts = Assets:Banks:Bank    # the site's accounts, for --ledger
+    """
 
     def pverbose(*args, **kwargs):
         if verbose:
@@ -123,14 +364,35 @@ def download(config_file, sites, site_types, dry_run, verbose):  # noqa: C901
             sites_lists = [get_sites(sites, site_type, config) for site_type in site_types]
             sites = [j for i in sites_lists for j in i]
 
+    not_needed = []
+    if ledger:
+        needed = sites_needing_updates(config, sites, ledger)
+        not_needed = [s for s in sites if s not in needed]
+        sites = needed
+
+    if not state_file:
+        state_file = config.defaults().get("state_file")
+    if state_file:
+        state_file = os.path.expanduser(os.path.expandvars(state_file))
+    else:
+        state_file = os.path.join(click.get_app_dir("bean-download"), "state.json")
+    state = read_state(state_file)
+
     errors = []
     success = []
+    fresh = []
     numsites = len(sites)
     displays = []
     print(f"Processing {numsites} institutions.")
 
     async def download_site(i, site):
         tid = f"[{i + 1}/{numsites} {site}]"
+        try:
+            await download_site_cmd(tid, site)
+        finally:
+            scheduler.done(site, site not in errors)
+
+    async def download_site_cmd(tid, site):
         pverbose(f"{tid}: Begin")
         try:
             options = config[site]
@@ -139,36 +401,68 @@ def download(config_file, sites, site_types, dry_run, verbose):  # noqa: C901
             displays.append([site, f"Couldn't find {site} in {config_file}"])
             return
 
+        if not force and is_fresh(options, state.get(site, {}), time.time()):
+            fresh.append(site)
+            pverbose(f"{tid}: Skipped, as it was downloaded less than min_interval ago")
+            return
+
+        if not await scheduler.wait_for_dependencies(site):
+            errors.append(site)
+            pverbose(f"{tid}: Skipped, as a site it depends on failed (or it depends on itself)")
+            return
+
         # We support cmd and display, and type to filter
         if "display" in options:
             displays.append([site, f"{options['display']}"])
             success.append(site)
         if "cmd" in options:
             cmd = os.path.expandvars(options["cmd"])
-            pverbose(f"{tid}: Executing: {cmd}")
-            if dry_run:
-                await asyncio.sleep(2)
-                success.append(site)
-                pverbose(f"{tid}: Success")
-            else:
-                # https://docs.python.org/3.8/library/asyncio-subprocess.html#asyncio.create_subprocess_exec
-                proc = await asyncio.create_subprocess_shell(
-                    cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-                )
-                stdout, stderr = await proc.communicate()
-
-                if proc.returncode:
-                    errors.append(site)
-                else:
+            timeout = parse_duration(options["timeout"]) if "timeout" in options else None
+            retries = int(options.get("retries", 0))
+            backoff = parse_duration(options.get("retry_backoff", "10s"))
+            for attempt in range(retries + 1):
+                if attempt:
+                    delay = backoff * 2 ** (attempt - 1)
+                    pverbose(f"{tid}: Retrying in {delay:g}s")
+                    await asyncio.sleep(delay)
+                async with scheduler.slot(site):
+                    pverbose(f"{tid}: Executing: {cmd}")
+                    start = time.time()
+                    if dry_run:
+                        await asyncio.sleep(2)
+                        returncode = 0
+                    else:
+                        returncode = await run_cmd(cmd, timeout)
+                        record_state(site, options, returncode, start)
+
+                if returncode == 0:
                     success.append(site)
                     pverbose(f"{tid}: Success")
+                    return
+                pverbose(f"{tid}: " + ("Timed out" if returncode is None else "Failed"))
+            errors.append(site)
+
+    def record_state(site, options, returncode, start):
+        site_state = state.setdefault(site, {})
+        now = time.time()
+        if returncode == 0:
+            site_state["last_success"] = now
+        site_state["exit_code"] = returncode  # None if it timed out
+        site_state["duration"] = round(now - start, 3)
+        output = output_file(options)
+        site_state["output_size"] = (
+            os.path.getsize(output) if output and os.path.exists(output) else None
+        )
 
     async def perform_downloads(sites):
         tasks = [download_site(i, site) for i, site in enumerate(sites)]
         for t in tqdm.tqdm(asyncio.as_completed(tasks), total=len(tasks)):
             await t
 
+    scheduler = Scheduler(config, sites, jobs)
     asyncio.run(perform_downloads(sites))
+    if not dry_run:
+        write_state(state_file, state)
 
     if displays:
         print()
@@ -184,8 +478,12 @@ def download(config_file, sites, site_types, dry_run, verbose):  # noqa: C901
     s = len(sites)
     if success:
         print(f"{len(success)}/{s} sites succeeded: {', '.join(success)}")
+    if fresh:
+        print(f"{len(fresh)}/{s} sites were fresh:  {', '.join(fresh)}")
     if errors:
         click.secho(f"{len(errors)}/{s} sites failed:    {', '.join(errors)}", fg="red")
+    if not_needed:
+        print(f"{len(not_needed)} sites don't need updates: {', '.join(not_needed)}")
 
 
 @cli.command(aliases=["init"])
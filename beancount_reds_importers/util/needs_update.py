@@ -2,29 +2,32 @@
 """Determine the list of accounts needing updates based on the last balance entry."""
 
 import ast
+import bisect
+import csv
+import io
+import json
+import os
 import re
+import socketserver
+import stat
+import sys
+import threading
 from datetime import datetime
 
 import click
 import tabulate
 from beancount import loader
-from beancount.core import getters
-from beancount.core.data import Balance, Close, Custom, Open
 from click.core import ParameterSource
 
+from beancount_reds_importers.util import needs_update_index
+
 tbl_options = {"tablefmt": "simple"}
 
 
-def get_config(entries, args, ctx):
+def get_config(summary, args, ctx):
     """Get beancount config for the given plugin that can then be used on the command line"""
     retval = {}
-    _extension_entries = [
-        e for e in entries if isinstance(e, Custom) and e.type == "reds-importers"
-    ]
-    config_meta = {
-        entry.values[0].value: (entry.values[1].value if (len(entry.values) == 2) else None)
-        for entry in _extension_entries
-    }
+    config_meta = {key: value for key, (_, value) in summary["config"].items()}
 
     config = {k: ast.literal_eval(v) for k, v in config_meta.items() if "needs-updates" in k}
     config = config.get("needs-updates", {})
@@ -37,20 +40,33 @@ def get_config(entries, args, ctx):
     )  # exclude nothing by default
     retval["excluded_re"] = re.compile("|".join(excluded_account_pats))
     retval["included_re"] = re.compile("|".join(included_account_pats))
+    retval["pattern_matches"] = {}  # account -> bool. See matches_account_pats()
 
     # what's supplied on the command line must always override what's in the config
     retval["recency"] = args["recency"]
-    recency_source = ctx.get_parameter_source("recency")
+    recency_source = ctx.get_parameter_source("recency") if ctx else ParameterSource.DEFAULT
     if recency_source == ParameterSource.DEFAULT and config.get("recency"):
         retval["recency"] = config.get("recency")
 
     return retval
 
 
+def matches_account_pats(account, config):
+    """Whether account is included and not excluded by the config's patterns. Memoized, as the
+    same accounts are checked over and over."""
+    pattern_matches = config.setdefault("pattern_matches", {})
+    try:
+        return pattern_matches[account]
+    except KeyError:
+        included = config["included_re"].match(account)
+        match = bool(included) and not config["excluded_re"].match(account)
+        pattern_matches[account] = match
+        return match
+
+
 def is_interesting_account(account, closes, config):
-    included_re = config["included_re"]
-    excluded_re = config["excluded_re"]
-    return account not in closes and included_re.match(account) and not excluded_re.match(account)
+    """closes is a set of closed accounts"""
+    return account not in closes and matches_account_pats(account, config)
 
 
 def handle_commodity_leaf_accounts_old(last_balance):
@@ -108,9 +124,8 @@ def handle_commodity_leaf_accounts(need_updates):
     return d
 
 
-def accounts_with_no_balance_entries(entries, closes, last_balance, config):
+def accounts_with_no_balance_entries(accounts, closes, last_balance, config):
     """Find interesting accounts with zero balance assertion entries."""
-    accounts = getters.get_accounts(entries)
     asset_accounts = [a for a in accounts if is_interesting_account(a, closes, config)]
     accs_no_bal_raw = [a for a in asset_accounts if a not in last_balance]
 
@@ -128,23 +143,77 @@ def accounts_with_no_balance_entries(entries, closes, last_balance, config):
     accs_no_bal = [acc_or_parent(i) for i in accs_no_bal_raw]
 
     # Remove accounts where one or more children do have a balance entry. Needed because of
-    # commodity leaf accounts
-    accs_no_bal = [
-        (i,) for i in set(accs_no_bal) if not any(j.startswith(i) for j in last_balance)
-    ]
+    # commodity leaf accounts. Accounts starting with i sort right after it, so only the first
+    # account not less than i needs to be checked
+    with_balance = sorted(last_balance)
+
+    def has_balance_entries(i):
+        idx = bisect.bisect_left(with_balance, i)
+        return idx < len(with_balance) and with_balance[idx].startswith(i)
+
+    accs_no_bal = [(i,) for i in set(accs_no_bal) if not has_balance_entries(i)]
     return accs_no_bal
 
 
 def pretty_print_table(not_updated_accounts, sort_by_date):
+    print(click.style(format_table(not_updated_accounts, sort_by_date)))
+
+
+def format_table(not_updated_accounts, sort_by_date):
+    headers = ["Last Updated", "Threshold", "Account"]
+    output = sort_not_updated(not_updated_accounts, sort_by_date)
+    return tabulate.tabulate(output, headers=headers, **tbl_options)
+
+
+def sort_not_updated(not_updated_accounts, sort_by_date):
+    """Return [(last updated, threshold, account), ...] sorted by date or account"""
     field = 0 if sort_by_date else 2
-    output = sorted(
+    return sorted(
         [(v[0], v[1], k) for k, v in not_updated_accounts.items()], key=lambda x: x[field]
     )
-    headers = ["Last Updated", "Threshold", "Account"]
-    print(click.style(tabulate.tabulate(output, headers=headers, **tbl_options)))
 
 
-def get_account_thresholds(entries):
+def format_output(need_updates, accs_no_bal, output_format, sort_by_date):
+    """Format the accounts needing updates and those without balance entries as a table, json, or
+    csv"""
+    if output_format == "json":
+        return (
+            json.dumps(
+                {
+                    "needs_update": [
+                        {"account": acc, "last_updated": date.isoformat(), "threshold": threshold}
+                        for date, threshold, acc in sort_not_updated(need_updates, sort_by_date)
+                    ],
+                    "no_balance_entries": [acc for (acc,) in sorted(accs_no_bal)],
+                },
+                indent=2,
+                default=lambda d: int(d) if d == int(d) else float(d),  # Decimal thresholds
+            )
+            + "\n"
+        )
+
+    if output_format == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["account", "last_updated", "threshold"])
+        for date, threshold, acc in sort_not_updated(need_updates, sort_by_date):
+            writer.writerow([acc, date.isoformat(), threshold])
+        for (acc,) in sorted(accs_no_bal):
+            writer.writerow([acc, "", ""])
+        return out.getvalue()
+
+    output = ""
+    if need_updates:
+        output += click.style(format_table(need_updates, sort_by_date)) + "\n"
+    # If there are accounts with zero balance entries, print them
+    if accs_no_bal:
+        headers = ["Accounts without balance entries:"]
+        table = tabulate.tabulate(sorted(accs_no_bal), headers=headers, **tbl_options)
+        output += click.style("\n" + table) + "\n"
+    return output
+
+
+def get_account_thresholds(summary):
     """
     If per-account thresholds are specified, get them.
 
@@ -156,11 +225,8 @@ def get_account_thresholds(entries):
 
     """
 
-    return {
-        strip_commodity_leaf(op.account): op.meta["needs_update_days"]
-        for op in entries
-        if isinstance(op, Open) and "needs_update_days" in op.meta
-    }
+    thresholds = sorted(summary["thresholds"].items(), key=lambda x: x[1][0])
+    return {strip_commodity_leaf(account): days for account, (_, days) in thresholds}
 
 
 @click.command("needs-update", context_settings={"show_default": True})
@@ -176,14 +242,42 @@ def get_account_thresholds(entries):
     is_flag=False,
 )
 @click.option("--sort-by-date", help="Sort output by date (instead of account name)", is_flag=True)
+@click.option(
+    "--index",
+    help="File in which to keep an index of the ledger, so that only the files in it that changed "
+    "since the last run are parsed. See needs_update_index.py",
+    type=click.Path(dir_okay=False),
+    envvar="NEEDS_UPDATE_INDEX",
+)
 @click.option(
     "--all-accounts",
     help="Show all account (ignore include/exclude in config)",
     is_flag=True,
 )
+@click.option(
+    "--format",
+    "output_format",
+    help="Output format",
+    type=click.Choice(["table", "json", "csv"]),
+    default="table",
+)
+@click.option(
+    "--watch",
+    help="Keep running, and serve the output to each client connecting to a unix socket at this "
+    "path (eg: `socat - UNIX-CONNECT:<path>`). The ledger is reloaded when its files change",
+    type=click.Path(dir_okay=False),
+)
 @click.pass_context
 def accounts_needing_updates(
-    ctx, beancount_file, recency, ignore_metadata, sort_by_date, all_accounts
+    ctx,
+    beancount_file,
+    recency,
+    ignore_metadata,
+    sort_by_date,
+    index,
+    all_accounts,
+    output_format,
+    watch,
 ):
     """
     Show a list of accounts needing updates, and the date of the last update (which is defined as
@@ -223,44 +317,120 @@ def accounts_needing_updates(
      }}"
     """
 
-    entries, _, _ = loader.load_file(beancount_file)
-    config = get_config(entries, locals(), ctx)
-    closes = [a.account for a in entries if isinstance(a, Close)]
-    balance_entries = [
-        a
-        for a in entries
-        if isinstance(a, Balance) and is_interesting_account(a.account, closes, config)
-    ]
-    last_balance = {v.account: v for v in balance_entries}
-    last_balance = handle_commodity_leaf_accounts_old(last_balance)
+    args = locals()
+    if watch:
+        serve(watch, LedgerWatcher(beancount_file, index), args, ctx)
+        return
+    summary, _ = load_summary(beancount_file, index)
+    print(needs_updates_output(summary, args, ctx), end="")
+
+
+def load_summary(beancount_file, index):
+    """Return the summary of the ledger (see needs_update_index.summarize()), and its files"""
+    if index:
+        summary = needs_update_index.load(beancount_file, index)
+        return summary, summary["files"]
+    entries, _, options_map = loader.load_file(beancount_file)
+    return needs_update_index.summarize(entries), options_map["include"]
+
+
+def needs_updates_output(summary, args, ctx):
+    need_updates, accs_no_bal = find_needs_updates(summary, args, ctx)
+    return format_output(need_updates, accs_no_bal, args["output_format"], args["sort_by_date"])
+
+
+def get_accounts_needing_updates(beancount_file, index=None):
+    """Return the set of accounts needing updates in a ledger, including those without balance
+    entries, with the default options of needs-update. Used by bean-download."""
+    summary, _ = load_summary(beancount_file, index)
+    args = {"recency": 15, "ignore_metadata": False, "all_accounts": False}
+    need_updates, accs_no_bal = find_needs_updates(summary, args)
+    return set(need_updates) | {acc for (acc,) in accs_no_bal}
+
+
+def find_needs_updates(summary, args, ctx=None):
+    """Return ({account needing updates: (last updated, threshold)}, [(account without balance
+    entries,), ...])"""
+    config = get_config(summary, args, ctx)
+    closes = summary["closes"]
+    last_balance = {
+        account: date
+        for account, date in summary["last_balance"].items()
+        if is_interesting_account(account, closes, config)
+    }
+    last_balance = handle_commodity_leaf_accounts(last_balance)
 
-    account_thresholds = get_account_thresholds(entries)
+    account_thresholds = get_account_thresholds(summary)
 
     need_updates = {}
     today = datetime.now().date()
-    for acc, bal in last_balance.items():
+    for acc, date in last_balance.items():
         # look for an account-specific override in metadata
 
         threshold = config["recency"]
-        if not ignore_metadata:
+        if not args["ignore_metadata"]:
             custom_recency = account_thresholds.get(acc)
             threshold = custom_recency if custom_recency else config["recency"]
-        age = (today - bal.date).days
+        age = (today - date).days
         if age > threshold:
-            need_updates[acc] = bal.date, threshold
-
-    if need_updates:
-        pretty_print_table(need_updates, sort_by_date)
+            need_updates[acc] = date, threshold
 
-    # If there are accounts with zero balance entries, print them
-    accs_no_bal = accounts_with_no_balance_entries(entries, closes, last_balance, config)
-    if accs_no_bal:
-        headers = ["Accounts without balance entries:"]
-        print(
-            click.style(
-                "\n" + tabulate.tabulate(sorted(accs_no_bal), headers=headers, **tbl_options)
-            )
-        )
+    accs_no_bal = accounts_with_no_balance_entries(
+        summary["accounts"], closes, last_balance, config
+    )
+    return need_updates, accs_no_bal
+
+
+class LedgerWatcher:
+    """Keeps the summary of a ledger in memory, and reloads it when any of its files change."""
+
+    def __init__(self, beancount_file, index):
+        self.beancount_file = beancount_file
+        self.index = index
+        self.lock = threading.Lock()
+        self.mtimes = None
+        self.summary = None
+
+    def get_mtimes(self, files):
+        mtimes = {}
+        for f in files:
+            try:
+                mtimes[f] = os.stat(f).st_mtime_ns
+            except OSError:
+                mtimes[f] = None
+        return mtimes
+
+    def get_summary(self):
+        with self.lock:
+            if self.mtimes is None or self.get_mtimes(self.mtimes) != self.mtimes:
+                self.summary, files = load_summary(self.beancount_file, self.index)
+                self.mtimes = self.get_mtimes(files)
+            return self.summary
+
+
+def serve(socket_path, watcher, args, ctx):
+    """Serve the output to each client connecting to the unix socket at socket_path, until
+    interrupted. The ledger is only reloaded when its files change, and the output is computed
+    afresh for each client, as it depends on today's date."""
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            output = needs_updates_output(watcher.get_summary(), args, ctx)
+            self.wfile.write(output.encode("utf-8"))
+
+    if os.path.lexists(socket_path):
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            raise click.ClickException(f"{socket_path} exists and is not a socket")
+        os.remove(socket_path)  # left behind by an earlier run
+    watcher.get_summary()
+    with socketserver.ThreadingUnixStreamServer(socket_path, Handler) as server:
+        print(f"Serving on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
 
 
 if __name__ == "__main__":
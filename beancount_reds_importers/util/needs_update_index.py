@@ -0,0 +1,161 @@
+"""Persistent index of the parts of a ledger that needs-update looks at.
+
+Loading a large ledger with beancount takes a while, yet needs-update only looks at a small
+summary of it: its needs-updates config, the closed accounts, the date of the last balance
+assertion on each account, the list of accounts, and per-account thresholds (see summarize()).
+
+With `needs-update --index <file>`, this summary is computed for each file of the ledger (the main
+file and everything it includes) and kept in the index file along with the file's mtime and size.
+Each run then only parses files that changed since the last run, and merges the summaries of all
+files. Files are parsed without running the ledger's plugins, which needs-update doesn't need
+unless a plugin adds balance, open, or close directives.
+"""
+
+import glob
+import os
+import pickle
+import tempfile
+from os import path
+
+from beancount.core import getters
+from beancount.core.data import Balance, Close, Custom, Open
+from beancount.parser import parser
+
+# Bump this when the format of the index changes
+INDEX_VERSION = 1
+
+
+def summarize(entries):
+    """Return the summary of entries needs-update works with. Values that later entries override
+    are kept along with their date, so that summaries of several files can be merged:
+    {
+        "config": {reds-importers custom directive key: (date, value)},
+        "closes": set of closed accounts,
+        "last_balance": {account: date of its last balance assertion},
+        "accounts": set of all accounts,
+        "thresholds": {account: (date, needs_update_days in its open directive)},
+    }
+    """
+    summary = {
+        "config": {},
+        "closes": set(),
+        "last_balance": {},
+        "accounts": getters.get_accounts(entries),
+        "thresholds": {},
+    }
+    for entry in entries:
+        if isinstance(entry, Balance):
+            update_latest(summary["last_balance"], entry.account, entry.date)
+        elif isinstance(entry, Close):
+            summary["closes"].add(entry.account)
+        elif isinstance(entry, Open):
+            if "needs_update_days" in entry.meta:
+                value = (entry.date, entry.meta["needs_update_days"])
+                update_latest(summary["thresholds"], entry.account, value)
+        elif isinstance(entry, Custom) and entry.type == "reds-importers":
+            key = entry.values[0].value
+            value = entry.values[1].value if (len(entry.values) == 2) else None
+            update_latest(summary["config"], key, (entry.date, value))
+    return summary
+
+
+def update_latest(d, key, value):
+    """Set d[key] to value, unless d has a value for a later date. Values are dates, or tuples
+    starting with one."""
+
+    def date(v):
+        return v[0] if isinstance(v, tuple) else v
+
+    if key not in d or date(d[key]) <= date(value):
+        d[key] = value
+
+
+def merge(summaries):
+    """Merge the summaries of several files into one, as summarize() would have returned for all
+    their entries."""
+    merged = {
+        "config": {},
+        "closes": set(),
+        "last_balance": {},
+        "accounts": set(),
+        "thresholds": {},
+    }
+    for summary in summaries:
+        merged["closes"] |= summary["closes"]
+        merged["accounts"] |= summary["accounts"]
+        for name in ["config", "last_balance", "thresholds"]:
+            for key, value in summary[name].items():
+                update_latest(merged[name], key, value)
+    return merged
+
+
+def expand_includes(filename, includes):
+    """Resolve include directives in filename to file names, as beancount's loader does."""
+    cwd = path.dirname(filename)
+    filenames = []
+    for include in includes:
+        for match in glob.glob(path.join(cwd, include), recursive=True):
+            filenames.append(path.normpath(path.join(cwd, match)))
+    return filenames
+
+
+def index_file(filename):
+    """Parse a single file of the ledger, and return its index entry."""
+    st = os.stat(filename)
+    entries, _, options_map = parser.parse_file(filename)
+    return {
+        "mtime_ns": st.st_mtime_ns,
+        "size": st.st_size,
+        "includes": options_map["include"],
+        "summary": summarize(entries),
+    }
+
+
+def read_index(index):
+    try:
+        with open(index, "rb") as f:
+            files = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return {}
+    if not isinstance(files, dict) or files.get("version") != INDEX_VERSION:
+        return {}
+    return files["files"]
+
+
+def write_index(index, files):
+    # Write to a temporary file first, so concurrent runs never see a partial index
+    dirname = path.dirname(path.abspath(index))
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        pickle.dump({"version": INDEX_VERSION, "files": files}, f)
+    os.replace(tmp, index)
+
+
+def load(filename, index):
+    """Return the summary of the ledger in filename (see summarize()), using and updating the index
+    kept in the file index. The names of the ledger's files are added to it, under "files"."""
+    cached = read_index(index)
+    files = {}
+    changed = False
+    pending = [path.normpath(path.abspath(filename))]
+    while pending:
+        name = pending.pop()
+        if name in files:
+            continue
+        try:
+            st = os.stat(name)
+        except OSError:
+            continue  # beancount's loader reports this as an error, which needs-update ignores
+        entry = cached.get(name)
+        if entry is None or (entry["mtime_ns"], entry["size"]) != (st.st_mtime_ns, st.st_size):
+            entry = index_file(name)
+            changed = True
+        files[name] = entry
+        # Includes are globbed afresh each time, as a glob may match new files
+        pending.extend(reversed(expand_includes(name, entry["includes"])))
+
+    if changed or files.keys() != cached.keys():
+        write_index(index, files)
+    summary = merge(entry["summary"] for entry in files.values())
+    summary["files"] = list(files)
+    return summary
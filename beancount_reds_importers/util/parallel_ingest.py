@@ -0,0 +1,170 @@
+"""A drop-in replacement for beangulp.Ingest whose `extract` command identifies and extracts
+documents across several processes.
+
+Importers keep per-file state (self.file, self.rdr, ...), so a single instance can't be shared
+across threads. Instead, each worker process gets its own copy of the importers in CONFIG, and the
+entries extracted from each document are sent back to the main process. There, they are sorted,
+deduplicated, passed to hooks, and printed exactly as beangulp would, so the output doesn't depend
+on the number of workers. Use it in your import config like so:
+
+    from beancount_reds_importers.util import parallel_ingest
+
+    CONFIG = [...]
+
+    if __name__ == "__main__":
+        ingest = parallel_ingest.Ingest(CONFIG)
+        ingest()
+
+and run `my_config.py extract --jobs 8 ~/Downloads`.
+
+On platforms that can't fork (Windows, and macOS by default), workers can't inherit the importers
+from the main process. Pass a module level function that builds the CONFIG list instead, which each
+worker calls once on startup:
+
+    def get_config():
+        return CONFIG
+
+    ingest = parallel_ingest.Ingest(CONFIG, importers_factory=get_config)
+
+Without one, files are extracted one at a time on platforms that can't fork.
+"""
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import beangulp
+import click
+from beancount import loader
+from beangulp import exceptions, extract, identify, utils
+
+# Set in each worker process by _init_worker(), or inherited from the main process on fork
+_importers = None
+_existing_entries = None
+
+
+def _init_worker(importers_factory, existing_entries):
+    global _importers, _existing_entries
+    _importers = list(importers_factory())
+    _existing_entries = existing_entries
+
+
+def _extract_file(filename):
+    """Identify and extract a single document. Runs in a worker process.
+
+    Returns (index of the matching importer in CONFIG, entries, account), or None if no importer
+    identified the document."""
+    importer = identify.identify(_importers, filename)
+    if not importer:
+        return None
+    entries = extract.extract_from_file(importer, filename, _existing_entries)
+    return _importers.index(importer), entries, importer.account(filename)
+
+
+def walk(src, log):
+    for filename in utils.walk(src):
+        if os.path.getsize(filename) > identify.FILE_TOO_LARGE_THRESHOLD:
+            log(f"* {filename:} ... SKIP")
+            continue
+        yield filename
+
+
+@click.command("extract")
+@click.argument("src", nargs=-1, type=click.Path(exists=True, resolve_path=True))
+@click.option("--output", "-o", type=click.File("w"), default="-", help="Output file.")
+@click.option(
+    "--existing",
+    "-e",
+    type=click.Path(exists=True),
+    help="Existing Beancount ledger for de-duplication.",
+)
+@click.option("--reverse", "-r", is_flag=True, help="Sort entries in reverse order.")
+@click.option("--failfast", "-x", is_flag=True, help="Stop processing at the first error.")
+@click.option("--quiet", "-q", count=True, help="Suppress all output.")
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=None,
+    help="Number of worker processes. Defaults to the number of CPUs.",
+)
+@click.pass_obj
+def _extract(ctx, src, output, existing, reverse, failfast, quiet, jobs):
+    """Extract transactions from documents, in parallel.
+
+    Walk the SRC list of files or directories and extract the ledger entries from each file
+    identified by one of the configured importers. The entries are written to the specified output
+    file or to the standard output in Beancount ledger format in sections associated to the source
+    document.
+    """
+    verbosity = -quiet
+    log = utils.logger(verbosity, err=True)
+    errors = exceptions.ExceptionsTrap(log)
+
+    existing_entries = loader.load_file(existing)[0] if existing else []
+    filenames = list(walk(src, log))
+
+    extracted = []
+    with ctx.executor(jobs, existing_entries) as executor:
+        # Submit everything up front, but collect results in walk order, so the log reads the
+        # same as beangulp's
+        futures = [executor.submit(_extract_file, filename) for filename in filenames]
+        for filename, future in zip(filenames, futures):
+            log(f"* {filename:}", nl=False)
+            with errors:
+                result = future.result()
+                if not result:
+                    log("")  # Newline.
+                    continue
+                log(" ...", nl=False)
+                index, entries, account = result
+                extracted.append((filename, entries, account, ctx.importers[index]))
+                log(" OK", fg="green")
+
+            if failfast and errors:
+                for f in futures:
+                    f.cancel()
+                break
+
+    # From here on, this is identical to beangulp's extract
+    extract.sort_extracted_entries(extracted)
+
+    for filename, entries, account, importer in extracted:
+        importer.deduplicate(entries, existing_entries)
+        existing_entries.extend(entries)
+
+    for func in ctx.hooks:
+        extracted = func(extracted, existing_entries)
+
+    extract.print_extracted_entries(extracted, output)
+
+    if errors:
+        sys.exit(1)
+
+
+class Ingest(beangulp.Ingest):
+    def __init__(self, importers, hooks=None, importers_factory=None):
+        super().__init__(importers, hooks)
+        self.importers_factory = importers_factory
+        self.cli.add_command(_extract)
+
+    def executor(self, jobs, existing_entries):
+        global _importers, _existing_entries
+        if self.importers_factory is None:
+            # Workers inherit (copies of) the importers and the ledger on fork
+            _importers, _existing_entries = self.importers, existing_entries
+            if "fork" not in multiprocessing.get_all_start_methods():
+                click.secho(
+                    "Can't fork worker processes on this platform without an importers_factory. "
+                    "Extracting one file at a time",
+                    fg="yellow",
+                    err=True,
+                )
+                return ThreadPoolExecutor(1)
+            return ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context("fork"))
+        return ProcessPoolExecutor(
+            jobs,
+            initializer=_init_worker,
+            initargs=(self.importers_factory, existing_entries),
+        )
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import time
+
+from click.testing import CliRunner
+
+from beancount_reds_importers.util import bean_download
+
+
+def download(tmp_path, config, *args):
+    config_file = tmp_path / "download.cfg"
+    config_file.write_text(config)
+    state_file = tmp_path / "state.json"
+    result = CliRunner().invoke(
+        bean_download.download, ["-c", str(config_file), "--state-file", str(state_file), *args]
+    )
+    return result.output
+
+
+def read_log(tmp_path):
+    return (tmp_path / "log").read_text().split()
+
+
+def test_dependencies_and_retries(tmp_path):
+    config = f"""
+[b]
+type = bank
+depends_on = a
+cmd = echo b >> {tmp_path}/log
+
+[a]
+type = bank
+retries = 2
+retry_backoff = 0.01
+cmd = test -f {tmp_path}/tried || (touch {tmp_path}/tried; exit 1); echo a >> {tmp_path}/log
+
+[c]
+type = bank
+depends_on = d
+cmd = echo c >> {tmp_path}/log
+
+[d]
+type = bank
+cmd = exit 1
+"""
+    output = download(tmp_path, config)
+    assert read_log(tmp_path) == ["a", "b"]
+    assert "2/4 sites succeeded: a, b" in output
+    assert "2/4 sites failed:    d, c" in output
+
+
+def test_dependency_cycle(tmp_path):
+    config = """
+[a]
+type = bank
+depends_on = b
+cmd = true
+
+[b]
+type = bank
+depends_on = a
+cmd = true
+"""
+    assert "2/2 sites failed" in download(tmp_path, config)
+
+
+def test_concurrency_limits(tmp_path):
+    site = (
+        f"type = bank\ncmd = echo start >> {tmp_path}/log; sleep 0.1; echo end >> {tmp_path}/log"
+    )
+    config = f"[DEFAULT]\nmax_concurrency_bank = 1\n[a]\n{site}\n[b]\n{site}\n[c]\n{site}\n"
+    download(tmp_path, config)
+    assert read_log(tmp_path) == ["start", "end"] * 3
+
+    (tmp_path / "log").unlink()
+    config = f"[a]\n{site}\n[b]\n{site}\n[c]\n{site}\n"
+    download(tmp_path, config, "--jobs", "2")
+    assert read_log(tmp_path)[:3] == ["start", "start", "end"]
+
+
+def test_rate_limit(tmp_path, monkeypatch):
+    # Record when the scheduler starts each command, rather than when each one gets going
+    starts = []
+
+    async def run_cmd(cmd, timeout=None):
+        starts.append(asyncio.get_running_loop().time())
+        return 0
+
+    monkeypatch.setattr(bean_download, "run_cmd", run_cmd)
+    site = "type = bank\nrate_limit = 0.3s\nrate_limit_group = bank\ncmd = true"
+    download(tmp_path, f"[a]\n{site}\n[b]\n{site}\n")
+    first, second = sorted(starts)
+    assert second - first >= 0.29  # asyncio may wake up a clock tick early
+
+
+def test_timeout(tmp_path):
+    start = time.time()
+    output = download(tmp_path, "[a]\ntype = bank\ntimeout = 0.2\ncmd = sleep 10\n")
+    assert time.time() - start < 5
+    assert "1/1 sites failed" in output
+
+
+def test_parse_duration():
+    assert bean_download.parse_duration("90") == 90
+    assert bean_download.parse_duration("5m") == 300
+    assert bean_download.parse_duration("12h") == 12 * 3600
+    assert bean_download.parse_duration("1d") == 86400
+
+
+def test_min_interval(tmp_path):
+    config = f"[a]\ntype = bank\nmin_interval = 12h\ncmd = echo a >> {tmp_path}/log\n"
+    download(tmp_path, config)
+    state = json.loads((tmp_path / "state.json").read_text())
+    assert state["a"]["exit_code"] == 0
+    assert time.time() - state["a"]["last_success"] < 60
+
+    output = download(tmp_path, config)
+    assert "1/1 sites were fresh:  a" in output
+    download(tmp_path, config, "--force")
+    assert read_log(tmp_path) == ["a", "a"]
+
+
+def test_min_interval_output(tmp_path):
+    output_file = tmp_path / "a.ofx"
+    config = f"""
+[a]
+type = bank
+min_interval = 1h
+output = {output_file}
+cmd = echo a >> {tmp_path}/log; echo ofx > {output_file}
+"""
+    download(tmp_path, config)
+    assert json.loads((tmp_path / "state.json").read_text())["a"]["output_size"] == 4
+    download(tmp_path, config)
+    assert read_log(tmp_path) == ["a"]
+
+    # An output file older than min_interval is downloaded again
+    two_hours_ago = time.time() - 7200
+    os.utime(output_file, (two_hours_ago, two_hours_ago))
+    download(tmp_path, config)
+    assert read_log(tmp_path) == ["a", "a"]
+
+
+def test_min_interval_failed(tmp_path):
+    # The shell creates the output file even though the command fails
+    config = f"""
+[a]
+type = bank
+min_interval = 1h
+output = {tmp_path}/a.ofx
+cmd = false > {tmp_path}/a.ofx
+"""
+    assert "1/1 sites failed" in download(tmp_path, config)
+    assert json.loads((tmp_path / "state.json").read_text())["a"]["exit_code"] == 1
+    output = download(tmp_path, config)
+    assert "fresh" not in output
+    assert "1/1 sites failed" in output
+
+
+def test_ledger(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    today = time.strftime("%Y-%m-%d")
+    ledger.write_text(f"""
+2020-01-01 open Assets:Bank:Checking
+2020-01-01 open Assets:Brokerage:Cash
+2020-01-02 balance Assets:Bank:Checking 0 USD
+{today} balance Assets:Brokerage:Cash 0 USD
+""")
+    site = f"type = bank\ncmd = echo $SITE >> {tmp_path}/log"
+    config = f"""
+[bank]
+accounts = Assets:Bank
+{site.replace("$SITE", "bank")}
+
+[brokerage]
+accounts = Assets:Brokerage:Cash
+{site.replace("$SITE", "brokerage")}
+
+[other]
+{site.replace("$SITE", "other")}
+"""
+    output = download(tmp_path, config, "--ledger", str(ledger))
+    assert sorted(read_log(tmp_path)) == ["bank", "other"]
+    assert "1 sites don't need updates: brokerage" in output
@@ -0,0 +1,146 @@
+import csv
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from click.testing import CliRunner
+
+from beancount_reds_importers.util import needs_update, needs_update_index
+
+MAIN = """
+option "operating_currency" "USD"
+include "accounts/*.beancount"
+
+2010-01-01 custom "reds-importers" "needs-updates" "{
+  'excluded_account_pats' : ['.*Inactive'],
+}"
+
+2010-01-01 open Assets:Banks:Checking
+2010-01-01 open Assets:Banks:Inactive
+2010-01-01 open Assets:Banks:Savings
+2010-01-01 open Assets:Banks:Old
+2010-01-01 open Equity:Opening
+2010-01-01 open Assets:Investments:Brokerage:VTI
+  needs_update_days: 10000
+
+2011-01-01 close Assets:Banks:Old
+
+2020-01-05 balance Assets:Banks:Checking 0 USD
+2020-01-10 balance Assets:Banks:Inactive 0 USD
+2020-01-10 balance Assets:Banks:Old 0 USD
+2020-01-10 balance Assets:Investments:Brokerage:VTI 0 VTI
+"""
+
+CHECKING = """
+2020-02-01 balance Assets:Banks:Checking 0 USD
+"""
+
+SAVINGS = """
+2020-02-01 balance Assets:Banks:Savings 0 USD
+"""
+
+
+def write(filename, contents):
+    with open(filename, "w") as f:
+        f.write(contents)
+
+
+def make_ledger(tmp_path):
+    ledger = tmp_path / "main.beancount"
+    os.mkdir(tmp_path / "accounts")
+    write(ledger, MAIN)
+    write(tmp_path / "accounts" / "checking.beancount", CHECKING)
+    return ledger
+
+
+def run(ledger, *args):
+    result = CliRunner().invoke(needs_update.accounts_needing_updates, [str(ledger), *args])
+    assert result.exit_code == 0, result.output
+    return result.output
+
+
+def test_index(tmp_path, monkeypatch):
+    ledger = make_ledger(tmp_path)
+    index = str(tmp_path / "index")
+
+    output = run(ledger)
+    assert "2020-02-01" in output
+    assert "Inactive" not in output and "Old" not in output and "VTI" not in output
+    assert "Savings" in output  # no balance entries
+    assert run(ledger, "--index", index) == output
+    assert os.path.exists(index)
+
+    # Unchanged files aren't parsed again
+    parsed = []
+    index_file = needs_update_index.index_file
+    monkeypatch.setattr(
+        needs_update_index, "index_file", lambda f: parsed.append(f) or index_file(f)
+    )
+    assert run(ledger, "--index", index) == output
+    assert parsed == []
+
+    # New and changed files are
+    write(tmp_path / "accounts" / "savings.beancount", "2020-03-01 open Assets:Banks:Cash\n")
+    output = run(ledger, "--index", index)
+    assert parsed == [str(tmp_path / "accounts" / "savings.beancount")]
+    assert output == run(ledger)
+    assert "Assets:Banks:Cash" in output
+
+
+def test_formats(tmp_path):
+    ledger = make_ledger(tmp_path)
+    output = json.loads(run(ledger, "--format", "json"))
+    assert output["needs_update"] == [
+        {"account": "Assets:Banks:Checking", "last_updated": "2020-02-01", "threshold": 15}
+    ]
+    assert output["no_balance_entries"] == ["Assets:Banks:Savings"]
+
+    rows = list(csv.reader(io.StringIO(run(ledger, "--format", "csv"))))
+    assert rows == [
+        ["account", "last_updated", "threshold"],
+        ["Assets:Banks:Checking", "2020-02-01", "15"],
+        ["Assets:Banks:Savings", "", ""],
+    ]
+
+
+def read_socket(socket_path):
+    with socket.socket(socket.AF_UNIX) as s:
+        s.connect(socket_path)
+        return json.loads(s.makefile().read())
+
+
+def test_watch(tmp_path):
+    ledger = make_ledger(tmp_path)
+    socket_path = str(tmp_path / "needs-update.sock")
+    args = [str(ledger), "--format", "json", "--watch", socket_path]
+    proc = subprocess.Popen([sys.executable, "-m", needs_update.__name__, *args])
+    try:
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.1)
+        assert read_socket(socket_path)["no_balance_entries"] == ["Assets:Banks:Savings"]
+
+        write(tmp_path / "accounts" / "checking.beancount", CHECKING + SAVINGS)
+        output = read_socket(socket_path)
+        assert output["no_balance_entries"] == []
+        assert output["needs_update"][1]["account"] == "Assets:Banks:Savings"
+    finally:
+        proc.send_signal(signal.SIGINT)
+        proc.wait(10)
+    assert not os.path.exists(socket_path)
+
+
+def test_watch_refuses_non_socket(tmp_path):
+    ledger = make_ledger(tmp_path)
+    result = CliRunner().invoke(
+        needs_update.accounts_needing_updates, [str(ledger), "--watch", str(ledger)]
+    )
+    assert result.exit_code == 1
+    assert "is not a socket" in result.output
+    assert ledger.read_text() == MAIN
@@ -0,0 +1,70 @@
+import importlib.util
+import multiprocessing
+from os import path
+
+import beangulp
+from click.testing import CliRunner
+
+from beancount_reds_importers.importers import vanguard
+from beancount_reds_importers.util import parallel_ingest
+
+EXAMPLE_DIR = path.join(path.dirname(__file__), "../../../example")
+FILES = [path.join(EXAMPLE_DIR, f) for f in ("OfxDownload.qfx", "transactions.qfx")]
+LEDGER = path.join(EXAMPLE_DIR, "my.beancount")
+
+
+def example_config():
+    spec = importlib.util.spec_from_file_location(
+        "example_import", path.join(EXAMPLE_DIR, "import.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CONFIG
+
+
+def extract(ingest, tmp_path, *args):
+    output = tmp_path / "output.beancount"
+    result = CliRunner().invoke(
+        ingest.cli, ["extract", "-o", str(output), "-e", LEDGER, *args, *FILES]
+    )
+    return result, output.read_text() if output.exists() else None
+
+
+def test_same_as_beangulp(tmp_path):
+    result, expected = extract(beangulp.Ingest(example_config()), tmp_path)
+    assert result.exit_code == 0, result.output
+    assert "Assets:Investments:TradIRA" in expected
+
+    # Workers inherit the importers on fork
+    result, output = extract(parallel_ingest.Ingest(example_config()), tmp_path, "-j", "2")
+    assert result.exit_code == 0, result.output
+    assert output == expected
+
+    # Each worker builds its own importers
+    ingest = parallel_ingest.Ingest(example_config(), importers_factory=example_config)
+    result, output = extract(ingest, tmp_path, "-j", "2")
+    assert result.exit_code == 0, result.output
+    assert output == expected
+
+
+def test_without_fork(tmp_path, monkeypatch):
+    _, expected = extract(beangulp.Ingest(example_config()), tmp_path)
+    monkeypatch.setattr(multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    result, output = extract(parallel_ingest.Ingest(example_config()), tmp_path, "-j", "2")
+    assert result.exit_code == 0, result.output
+    assert "one file at a time" in result.output
+    assert output == expected
+
+
+class FailingImporter(vanguard.Importer):
+    def extract(self, file, existing_entries=None):
+        raise ValueError("extraction failed")
+
+
+def test_failfast(tmp_path):
+    config = example_config()
+    failing = FailingImporter(config[0].config)
+    result, _ = extract(parallel_ingest.Ingest([failing, *config[1:]]), tmp_path, "-j", "2", "-x")
+    assert result.exit_code == 1
+    assert "extraction failed" in result.output
+    assert "transactions.qfx" not in result.output
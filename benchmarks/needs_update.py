@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Time needs-update's processing of a synthetic ledger, against the list and per-balance regex
+based filtering it used to do. The ledger is built in memory, so beancount's (identical) load time
+isn't included. Usage:
+
+    python benchmarks/needs_update.py --balances 10000 --balances 100000 --balances 400000
+"""
+
+import datetime
+import re
+import time
+
+import click
+from beancount.core import amount, data, getters
+from beancount.core.number import D
+
+from beancount_reds_importers.util import needs_update, needs_update_index
+
+
+def synthetic_ledger(balances, accounts, closes):
+    meta = data.new_metadata("<synthetic>", 0)
+    start = datetime.date(2010, 1, 1)
+    names = [f"Assets:Banks:Bank{i}" for i in range(accounts // 2)]
+    names += [f"Assets:Investments:Broker{i}:VTI" for i in range(accounts - len(names))]
+    entries = [data.Open(meta, start, name, None, None) for name in names]
+    entries += [
+        data.Balance(
+            meta,
+            start + datetime.timedelta(days=i * 5000 // balances),
+            names[i % len(names)],
+            amount.Amount(D(0), "USD"),
+            None,
+            None,
+        )
+        for i in range(balances)
+    ]
+    entries += [data.Close(meta, datetime.date(2024, 1, 1), name) for name in names[:closes]]
+    return entries
+
+
+def legacy(entries, config):
+    """needs-update's filtering as it used to be"""
+
+    def is_interesting_account(account, closes):
+        return (
+            account not in closes
+            and config["included_re"].match(account)
+            and not config["excluded_re"].match(account)
+        )
+
+    closes = [a.account for a in entries if isinstance(a, data.Close)]
+    balance_entries = [
+        a
+        for a in entries
+        if isinstance(a, data.Balance) and is_interesting_account(a.account, closes)
+    ]
+    last_balance = {v.account: v for v in balance_entries}
+    last_balance = needs_update.handle_commodity_leaf_accounts_old(last_balance)
+
+    accounts = getters.get_accounts(entries)
+    accs_no_bal = [
+        needs_update.strip_commodity_leaf(a)
+        for a in accounts
+        if is_interesting_account(a, closes) and a not in last_balance
+    ]
+    accs_no_bal = [
+        (i,) for i in set(accs_no_bal) if not any(j.startswith(i) for j in last_balance)
+    ]
+    return {k: v.date for k, v in last_balance.items()}, sorted(accs_no_bal)
+
+
+def current(entries, config):
+    summary = needs_update_index.summarize(entries)
+    closes = summary["closes"]
+    last_balance = {
+        account: date
+        for account, date in summary["last_balance"].items()
+        if needs_update.is_interesting_account(account, closes, config)
+    }
+    last_balance = needs_update.handle_commodity_leaf_accounts(last_balance)
+    accs_no_bal = needs_update.accounts_with_no_balance_entries(
+        summary["accounts"], closes, last_balance, config
+    )
+    return last_balance, sorted(accs_no_bal)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+@click.command()
+@click.option("--balances", multiple=True, type=int, default=[10000, 100000, 400000])
+@click.option("--accounts", default=2000, help="Number of accounts")
+@click.option("--closes", default=500, help="Number of closed accounts")
+def benchmark(balances, accounts, closes):
+    config = {
+        "included_re": re.compile("^Assets:|^Liabilities:"),
+        "excluded_re": re.compile(".*Inactive|.*Closed"),
+    }
+    print(f"{'balances':>10} {'legacy (s)':>11} {'current (s)':>12}")
+    for n in balances:
+        entries = synthetic_ledger(n, accounts, closes)
+        legacy_time, expected = timed(legacy, entries, config)
+        current_time, result = timed(current, entries, dict(config))
+        assert result == expected
+        print(f"{n:10} {legacy_time:11.2f} {current_time:12.2f}")
+
+
+if __name__ == "__main__":
+    benchmark()
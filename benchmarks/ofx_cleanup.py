@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Compare the streaming and BeautifulSoup SGML cleanups in ofxreader on synthetically scaled-up
+copies of the bundled test QFX files.
+
+Each file's transaction list is repeated until the file is roughly --size-mb large. Usage:
+
+    python benchmarks/ofx_cleanup.py --size-mb 5
+"""
+
+import re
+import time
+from io import StringIO
+from os import path
+
+import click
+import ofxparse
+
+from beancount_reds_importers.libreader import ofxreader
+
+IMPORTERS_DIR = path.join(path.dirname(__file__), "..", "beancount_reds_importers", "importers")
+FILES = [
+    "ally/tests/transactions.qfx",
+    "capitalonebank/tests/360Checking.qfx",
+    "etrade/tests/etrade_09092023.QFX",
+    "vanguard/tests/OfxDownload-401k.qfx",
+]
+TRANLIST_RE = re.compile(
+    r"(<(?:BANK|INV)TRANLIST>.*?<DTEND>[^<]*(?:</DTEND>)?)(.*?)(</(?:BANK|INV)TRANLIST>)",
+    re.DOTALL,
+)
+
+
+def scale_up(sgml_content, size_bytes):
+    m = TRANLIST_RE.search(sgml_content)
+    if not m or not m.group(2).strip():
+        return sgml_content
+    copies = max(1, size_bytes // len(m.group(2)))
+    return sgml_content[: m.end(1)] + m.group(2) * copies + sgml_content[m.start(3) :]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option("--size-mb", default=2, help="Approximate size of each scaled-up file")
+def benchmark(size_mb):
+    print(f"{'file':40} {'MB':>6} {'cleanup':>14} {'clean (s)':>10} {'parse (s)':>10}")
+    for f in FILES:
+        with open(path.join(IMPORTERS_DIR, f), encoding="utf-8") as fh:
+            sgml_content = scale_up(fh.read(), size_mb * 1024 * 1024)
+        mb = len(sgml_content) / 1024 / 1024
+        for name, cleaner in ofxreader.sgml_cleaners.items():
+            cleaned, clean_time = timed(cleaner, sgml_content)
+            _, parse_time = timed(ofxparse.OfxParser.parse, StringIO(cleaned))
+            print(f"{f:40} {mb:6.1f} {name:>14} {clean_time:10.2f} {parse_time:10.2f}")
+
+
+if __name__ == "__main__":
+    benchmark()
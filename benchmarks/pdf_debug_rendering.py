@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Time reading the bundled test pdfs with pdfreader's debug rendering turned off and on.
+
+With debug off, pages are not rendered to images. Debug files (.debug-pdf-*) are written to a
+temporary directory. Usage:
+
+    python benchmarks/pdf_debug_rendering.py --repeat 5
+"""
+
+import os
+import tempfile
+import time
+from os import path
+
+import click
+import pdfplumber
+
+from beancount_reds_importers.importers import genericpdfpaycheck, mercurycards
+
+IMPORTERS_DIR = path.join(path.dirname(__file__), "..", "beancount_reds_importers", "importers")
+FILES = [
+    (genericpdfpaycheck.Importer, "genericpdfpaycheck/tests/paystub.sample.pdf"),
+    (mercurycards.Importer, "mercurycards/tests/mercury_statement_20241105.pdf"),
+]
+
+
+def with_debug(importer_class, debug):
+    class Importer(importer_class):
+        def custom_init(self):
+            super().custom_init()
+            self.debug = debug
+
+    return Importer({"currency": "USD", "paycheck_template": {}})
+
+
+def time_read(importer_class, file, debug, repeat):
+    importer = with_debug(importer_class, debug)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        importer.initialize(file)
+        importer.read_file(file)
+        importer.file = None  # force a fresh read on the next round
+    return (time.perf_counter() - start) / repeat
+
+
+@click.command()
+@click.option("--repeat", default=3, help="Number of times to read each file")
+def benchmark(repeat):
+    print(f"{'file':50} {'pages':>5} {'debug':>6} {'s/page':>8}")
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            for importer_class, f in FILES:
+                file = path.abspath(path.join(cwd, IMPORTERS_DIR, f))
+                with pdfplumber.open(file) as pdf:
+                    pages = len(pdf.pages)
+                for debug in (False, True):
+                    per_page = time_read(importer_class, file, debug, repeat) / pages
+                    print(f"{f:50} {pages:5} {debug!s:>6} {per_page:8.3f}")
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    benchmark()
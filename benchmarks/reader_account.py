@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Time Reader.account(), which beangulp calls for each file, against the inspect.getouterframes()
+based smart_importer detection it used to do on every call.
+
+Calls are made from --depth nested frames, to mimic being called from deep within beangulp. Usage:
+
+    python benchmarks/reader_account.py --calls 2000
+"""
+
+import inspect
+import time
+from os import path
+
+import click
+
+from beancount_reds_importers.importers import ally
+
+QFX = path.join(path.dirname(__file__), "..", "beancount_reds_importers", "importers", "ally")
+QFX = path.join(QFX, "tests", "transactions.qfx")
+
+
+def legacy_account(importer, file):
+    """Reader.account() as it used to be"""
+    calframe = inspect.getouterframes(inspect.currentframe(), 2)
+    if (
+        any("predictor" in i.filename for i in calframe)
+        and "smart_importer_hack" in importer.config
+    ):
+        return importer.config["smart_importer_hack"]
+    importer.initialize(file)
+    return importer.config["main_account"]
+
+
+def nested(depth, fn, *args):
+    if depth:
+        return nested(depth - 1, fn, *args)
+    return fn(*args)
+
+
+def timed(calls, depth, fn, *args):
+    start = time.perf_counter()
+    for _ in range(calls):
+        nested(depth, fn, *args)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+@click.command()
+@click.option("--calls", default=2000, help="Number of calls to time")
+@click.option("--depth", default=30, help="Stack depth to call from")
+def benchmark(calls, depth):
+    print(f"{'smart_importer_hack':20} {'legacy (us/call)':>17} {'account (us/call)':>18}")
+    for config in ({}, {"smart_importer_hack": "Assets:Banks:Checking"}):
+        importer = ally.Importer(
+            {"account_number": "23456", "main_account": "Assets:Banks:Checking", **config}
+        )
+        importer.account(QFX)  # read the file once up front
+        legacy = timed(calls, depth, legacy_account, importer, QFX)
+        current = timed(calls, depth, importer.account, QFX)
+        print(f"{bool(config)!s:20} {legacy:17.1f} {current:18.1f}")
+
+
+if __name__ == "__main__":
+    benchmark()